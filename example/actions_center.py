@@ -30,9 +30,9 @@ def center(self, resize: str) -> None:
     focused = self.i3ipc.get_tree().find_focused()
     if resize in {"default", "none"}:
         geom = self.center_geom(focused)
-        actions.set_geom(focused, geom)
+        self.set_geom(focused, geom)
     elif resize in {"resize", "on", "yes"}:
         geom = self.center_geom(focused, change_geom=True)
-        actions.set_geom(focused, geom)
+        self.set_geom(focused, geom)
     else:
         return
@@ -56,4 +56,4 @@ def x4(self, mode: int) -> None:
             if prev != self.current_win.id:
                 geom = self.get_prev_geom()
 
-        actions.set_geom(self.current_win, geom)
+        self.set_geom(self.current_win, geom)
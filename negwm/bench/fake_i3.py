@@ -0,0 +1,518 @@
+""" Stand-in i3 IPC server for benchmarks. It speaks the real i3 binary protocol over a unix socket, serves a synthetic layout tree,
+executes the subset of RUN_COMMAND used by negwm modules and sends the window/workspace/binding/tick events i3 would send for them, so
+modules run against it unmodified. Unknown commands succeed without changing the tree. """
+
+import json
+import os
+import queue
+import re
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+class FakeI3():
+    magic=b'i3-ipc'
+    header=struct.Struct('=II')
+    # Message types
+    RUN_COMMAND, GET_WORKSPACES, SUBSCRIBE, GET_OUTPUTS, GET_TREE, \
+        GET_MARKS, GET_BAR_CONFIG, GET_VERSION, GET_BINDING_MODES, \
+        GET_CONFIG, SEND_TICK, SYNC=range(12)
+    # Event types, the high bit is set on the wire
+    events={
+        'workspace': 0, 'output': 1, 'mode': 2, 'window': 3,
+        'barconfig_update': 4, 'binding': 5, 'shutdown': 6, 'tick': 7,
+    }
+    criteria_re=re.compile(r'(\w+)="?([^"\]\s]*)"?')
+    screen={'x': 0, 'y': 0, 'width': 3440, 'height': 1440}
+
+    def __init__(self, path: str='', workspaces: int=10,
+                 tree: Optional[Dict]=None) -> None:
+        """ path: unix socket path, temporary one by default.
+            workspaces: number of workspaces on the fake output.
+            tree: GET_TREE reply to serve instead of the synthetic one. """
+        self.path=path or os.path.join(
+            tempfile.mkdtemp(prefix='negwm-fake-i3-'), 'ipc.sock')
+        self.lock=threading.RLock()
+        self.subscribers: Dict[socket.socket, Tuple[set, queue.Queue]]={}
+        self.counters: Dict[int, int]={} # message type -> requests
+        self.emitted=0 # events sent, except ticks
+        self.command_events=True # send events caused by RUN_COMMAND
+        self.muted=False
+        self.last_id=0
+        self.server=None
+        self.nodes: Dict[int, dict]={}  # con_id -> node
+        self.parents: Dict[int, dict]={} # con_id -> parent node
+        self.focused_id=None
+        self.workspaces: List[dict]=[]
+        if tree is not None:
+            self.load(tree)
+            return
+        self.root=self.node('root', 'root')
+        scratch_out=self.node('__i3', 'output')
+        scratch_content=self.node('content', 'con')
+        self.scratch=self.node('__i3_scratch', 'workspace')
+        self.attach(self.root, scratch_out)
+        self.attach(scratch_out, scratch_content)
+        self.attach(scratch_content, self.scratch)
+        output=self.node('FAKE-1', 'output')
+        self.content=self.node('content', 'con')
+        self.attach(self.root, output)
+        self.attach(output, self.content)
+        for num in range(1, workspaces + 1):
+            ws=self.node(str(num), 'workspace')
+            ws['num']=num
+            self.attach(self.content, ws)
+            self.workspaces.append(ws)
+        self.current_ws=self.workspaces[0]
+
+    def load(self, tree: Dict) -> None:
+        """ Serve real i3 tree, for example the snapshot from session log. """
+        self.root=tree
+        self.scratch=None
+        stack=[tree]
+        while stack:
+            node=stack.pop()
+            self.nodes[node['id']]=node
+            self.last_id=max(self.last_id, node['id'])
+            for child in node.get('nodes', []) + node.get('floating_nodes', []):
+                self.parents[child['id']]=node
+                stack.append(child)
+            if node.get('focused'):
+                self.focused_id=node['id']
+            if node['type'] == 'workspace':
+                if node['name'] == '__i3_scratch':
+                    self.scratch=node
+                else:
+                    self.workspaces.append(node)
+        self.workspaces.sort(key=lambda ws: ws.get('num', 0))
+        focused=self.workspace_of(self.nodes.get(self.focused_id))
+        self.current_ws=focused or self.workspaces[0]
+
+    def node(self, name: str, con_type: str, props: Optional[Dict]=None) -> dict:
+        self.last_id+=1
+        node={
+            'id': self.last_id, 'type': con_type, 'name': name,
+            'nodes': [], 'floating_nodes': [], 'focus': [], 'focused': False,
+            'rect': dict(FakeI3.screen), 'marks': [], 'fullscreen_mode': 0,
+            'layout': 'splith', 'urgent': False, 'window': None,
+            'floating': 'auto_off', 'scratchpad_state': 'none',
+        }
+        if props is not None:
+            node['window']=self.last_id + 0x1000000
+            node['window_properties']=props
+        self.nodes[node['id']]=node
+        return node
+
+    def attach(self, parent: dict, node: dict, floating: bool=False) -> None:
+        parent['floating_nodes' if floating else 'nodes'].append(node)
+        parent['focus'].append(node['id'])
+        self.parents[node['id']]=parent
+
+    def detach(self, node: dict) -> None:
+        parent=self.parents.pop(node['id'])
+        for key in 'nodes', 'floating_nodes':
+            if node in parent[key]:
+                parent[key].remove(node)
+        if node['id'] in parent['focus']:
+            parent['focus'].remove(node['id'])
+        # i3 destroys floating wrappers together with their last child
+        if parent['type'] == 'floating_con' and not parent['nodes']:
+            self.detach(parent)
+            self.nodes.pop(parent['id'], None)
+
+    def workspace_of(self, node: dict) -> Optional[dict]:
+        while node is not None and node['type'] != 'workspace':
+            node=self.parents.get(node['id'])
+        return node
+
+    # Public API for benchmark scenarios
+
+    def add_window(self, wclass: str, instance: str='', title: str='',
+                   role: str='', ws: int=0, emit: bool=True) -> int:
+        """ Create new tiled window on the workspace number ws (current one by
+        default), send window::new. Like i3, focus it when it is opened on the
+        current workspace. Returns con_id. """
+        with self.lock:
+            props={'class': wclass, 'instance': instance or wclass.lower(),
+                   'title': title or wclass, 'window_role': role}
+            win=self.node(title or wclass, 'con', props)
+            target=self.workspaces[ws - 1] if ws else self.current_ws
+            self.attach(target, win)
+            if emit:
+                self.window_event('new', win)
+            if target is self.current_ws or self.focused_id is None:
+                self.focus(win, emit)
+            return win['id']
+
+    def close_window(self, con_id: int) -> None:
+        with self.lock:
+            win=self.nodes.pop(con_id, None)
+            if win is None:
+                return
+            self.detach(win)
+            if self.focused_id == con_id:
+                self.focused_id=None
+            self.window_event('close', win)
+
+    def set_title(self, con_id: int, title: str) -> None:
+        with self.lock:
+            win=self.nodes[con_id]
+            win['name']=win['window_properties']['title']=title
+            self.window_event('title', win)
+
+    def binding(self, cmd: str) -> None:
+        """ Send binding event, like user pressed key bound to cmd. """
+        self.emit('binding', {'change': 'run', 'binding': {
+            'command': cmd, 'event_state_mask': [], 'input_code': 0,
+            'symbol': None, 'input_type': 'keyboard', 'mods': [],
+        }})
+
+    def tick(self, payload: str='') -> None:
+        self.emit('tick', {'first': False, 'payload': payload})
+
+    def inject(self, event: str, payload: dict) -> None:
+        """ Send recorded i3 event, applying it to the served tree first, so
+        GET_TREE stays close to what the real i3 returned at that moment. """
+        with self.lock:
+            con=payload.get('container')
+            node=self.nodes.get(con['id']) if con else None
+            change=payload.get('change')
+            if event == 'window' and con is not None:
+                if change == 'new' and node is None:
+                    node=con
+                    self.nodes[node['id']]=node
+                    self.attach(self.current_ws, node)
+                elif change == 'close' and node is not None:
+                    self.nodes.pop(node['id'])
+                    self.detach(node)
+                    if self.focused_id == node['id']:
+                        self.focused_id=None
+                elif change == 'focus' and node is not None:
+                    self.focus(node, emit=False)
+                elif node is not None:
+                    for key in 'name', 'marks', 'urgent', 'fullscreen_mode', \
+                            'window_properties', 'floating', 'rect':
+                        if key in con:
+                            node[key]=con[key]
+            elif event == 'workspace' and change == 'focus':
+                ws=self.nodes.get((payload.get('current') or {}).get('id'))
+                if ws is not None:
+                    self.current_ws=ws
+            self.emit(event, payload)
+
+    def windows(self) -> List[dict]:
+        with self.lock:
+            return [n for n in self.nodes.values() if n.get('window')]
+
+    @staticmethod
+    def stats_name(msg_type: int) -> str:
+        return {
+            FakeI3.RUN_COMMAND: 'run_command', FakeI3.GET_TREE: 'get_tree',
+            FakeI3.GET_WORKSPACES: 'get_workspaces', FakeI3.SEND_TICK: 'tick',
+        }.get(msg_type, str(msg_type))
+
+    def stats(self) -> Dict[str, int]:
+        return {FakeI3.stats_name(k): v for k, v in self.counters.items()}
+
+    # Events
+
+    def window_event(self, change: str, win: dict) -> None:
+        self.emit('window', {'change': change, 'container': win})
+
+    def emit(self, event: str, payload: dict) -> None:
+        """ Queue event for subscribers. Every subscriber has its own sender
+        thread, so a slow client never blocks command replies. """
+        with self.lock:
+            if self.muted:
+                return
+            if event != 'tick':
+                self.emitted+=1
+            msg=self.pack(FakeI3.events[event] | 1 << 31, json.dumps(payload).encode())
+            for events, out in self.subscribers.values():
+                if event in events:
+                    out.put(msg)
+
+    def subscribed(self, event: str) -> bool:
+        with self.lock:
+            return any(event in events for events, _ in self.subscribers.values())
+
+    def subscribe(self, sock, events: set) -> queue.Queue:
+        with self.lock:
+            if sock in self.subscribers:
+                self.subscribers[sock][0].update(events)
+                return self.subscribers[sock][1]
+            out=queue.Queue()
+            self.subscribers[sock]=(events, out)
+
+        def sender():
+            while True:
+                msg=out.get()
+                try:
+                    sock.sendall(msg)
+                except OSError:
+                    with self.lock:
+                        self.subscribers.pop(sock, None)
+                    return
+        threading.Thread(target=sender, daemon=True).start()
+        return out
+
+    # Commands
+
+    def focus(self, win: dict, emit: bool=True) -> None:
+        if win['id'] == self.focused_id:
+            return
+        prev=self.nodes.get(self.focused_id)
+        if prev is not None:
+            prev['focused']=False
+        win['focused']=True
+        self.focused_id=win['id']
+        child, parent=win, self.parents.get(win['id'])
+        while parent is not None:
+            if child['id'] in parent['focus']:
+                parent['focus'].remove(child['id'])
+            parent['focus'].insert(0, child['id'])
+            child, parent=parent, self.parents.get(parent['id'])
+        ws=self.workspace_of(win)
+        if ws is not None and ws is not self.current_ws and ws is not self.scratch:
+            old, self.current_ws=self.current_ws, ws
+            if emit:
+                self.emit('workspace', {'change': 'focus', 'current': ws, 'old': old})
+        if emit:
+            self.window_event('focus', win)
+
+    def move(self, win: dict, target: dict, floating: bool) -> None:
+        self.detach(win)
+        if floating:
+            wrapper=self.node('', 'floating_con')
+            self.attach(target, wrapper, floating=True)
+            self.attach(wrapper, win)
+        else:
+            self.attach(target, win)
+        win['floating']='user_on' if floating else 'auto_off'
+        self.window_event('move', win)
+
+    def criteria(self, text: str) -> List[dict]:
+        if not text:
+            win=self.nodes.get(self.focused_id)
+            return [win] if win is not None else []
+        crit=dict(FakeI3.criteria_re.findall(text))
+        ret=[]
+        for win in self.windows():
+            props=win.get('window_properties') or {}
+            if 'con_id' in crit and crit['con_id'] != '__focused__' \
+                    and str(win['id']) != crit['con_id']:
+                continue
+            if crit.get('con_id') == '__focused__' and win['id'] != self.focused_id:
+                continue
+            if 'id' in crit and str(win['window']) != crit['id']:
+                continue
+            if 'con_mark' in crit and not any(
+                    re.search(crit['con_mark'], m) for m in win['marks']):
+                continue
+            if 'class' in crit and not re.search(crit['class'], props.get('class') or ''):
+                continue
+            if 'instance' in crit and not re.search(crit['instance'], props.get('instance') or ''):
+                continue
+            ret.append(win)
+        return ret
+
+    def execute(self, wins: List[dict], cmd: str) -> Tuple[bool, str]:
+        words=cmd.split()
+        if not words:
+            return False, 'empty command'
+        verb, args=words[0], words[1:]
+        if verb in {'exec', 'nop', 'reload', 'restart', 'mode', 'resize', 'layout'}:
+            return True, ''
+        if verb == 'workspace' and args:
+            ws=next((w for w in self.workspaces if w['name'] == args[-1]), None)
+            if ws is not None:
+                self.current_ws=ws
+            return True, ''
+        if verb == 'scratchpad' and args == ['show']:
+            for win in wins or [w for w in self.windows()
+                                if self.workspace_of(w) is self.scratch][:1]:
+                if self.workspace_of(win) is self.scratch:
+                    self.move(win, self.current_ws, floating=True)
+                    win['scratchpad_state']='changed'
+                    self.focus(win)
+                elif win['scratchpad_state'] != 'none':
+                    self.move(win, self.scratch, floating=True)
+            return True, ''
+        if not wins:
+            return False, 'No window matches given criteria'
+        for win in wins:
+            if verb == 'focus':
+                if self.workspace_of(win) is not self.scratch:
+                    self.focus(win)
+            elif verb == 'move' and args[-1:] == ['scratchpad']:
+                self.move(win, self.scratch, floating=True)
+                if win['scratchpad_state'] == 'none':
+                    win['scratchpad_state']='fresh'
+            elif verb == 'move' and 'workspace' in args:
+                target=self.current_ws if args[-1] == 'current' else next(
+                    (w for w in self.workspaces if w['name'] == args[-1]),
+                    self.current_ws)
+                self.move(win, target, floating=win['floating'] == 'user_on')
+            elif verb == 'floating' and args:
+                self.move(win, self.workspace_of(win) or self.current_ws,
+                          floating=args[0] == 'enable' or (
+                              args[0] == 'toggle' and win['floating'] != 'user_on'))
+            elif verb == 'mark':
+                marks=[a for a in args if not a.startswith('--')]
+                if '--add' not in args:
+                    for other in self.windows():
+                        if other is not win and set(other['marks']) & set(marks):
+                            other['marks']=[m for m in other['marks'] if m not in marks]
+                    win['marks']=[]
+                win['marks']+=[m for m in (m.strip('"') for m in marks) if m not in win['marks']]
+                self.window_event('mark', win)
+            elif verb == 'unmark':
+                win['marks']=[m for m in win['marks'] if args and m != args[0]]
+                self.window_event('mark', win)
+            elif verb == 'fullscreen':
+                mode=args[0] if args else 'toggle'
+                state=mode == 'enable' or (mode == 'toggle' and not win['fullscreen_mode'])
+                if int(state) != win['fullscreen_mode']:
+                    win['fullscreen_mode']=int(state)
+                    self.window_event('fullscreen_mode', win)
+            elif verb == 'kill':
+                self.close_window(win['id'])
+        return True, ''
+
+    def run_command(self, payload: str) -> List[dict]:
+        """ Execute `[criteria] cmd, cmd; [criteria] cmd` chain. One reply per
+        ',' or ';' separated command, like i3 does. Caused events are not sent
+        when command_events is off: replayed sessions already contain them. """
+        replies=[]
+        with self.lock:
+            self.muted=not self.command_events
+            try:
+                for chain in FakeI3.split(payload, ';'):
+                    chain=chain.strip()
+                    crit=''
+                    if chain.startswith('['):
+                        end=chain.find(']')
+                        crit, chain=chain[1:end], chain[end + 1:]
+                    wins=self.criteria(crit)
+                    for cmd in FakeI3.split(chain, ','):
+                        success, error=self.execute(wins, cmd.strip())
+                        reply={'success': success}
+                        if error:
+                            reply['error']=error
+                        replies.append(reply)
+            finally:
+                self.muted=False
+        return replies
+
+    @staticmethod
+    def split(text: str, sep: str) -> List[str]:
+        """ Split by separator outside of quotes. """
+        ret, part, quoted=[], '', False
+        for char in text:
+            if char == '"':
+                quoted=not quoted
+            if char == sep and not quoted:
+                ret.append(part)
+                part=''
+            else:
+                part+=char
+        ret.append(part)
+        return ret
+
+    # Replies
+
+    def get_workspaces(self) -> List[dict]:
+        focused=self.workspace_of(self.nodes.get(self.focused_id)) \
+            if self.focused_id else None
+        return [{
+            'id': ws['id'], 'num': ws['num'], 'name': ws['name'],
+            'visible': ws is self.current_ws, 'focused': ws is (focused or self.current_ws),
+            'urgent': False, 'rect': ws['rect'], 'output': 'FAKE-1',
+        } for ws in self.workspaces]
+
+    def reply(self, msg_type: int, payload: bytes):
+        self.counters[msg_type]=self.counters.get(msg_type, 0) + 1
+        if msg_type == FakeI3.RUN_COMMAND:
+            return self.run_command(payload.decode())
+        if msg_type == FakeI3.GET_TREE:
+            with self.lock:
+                return self.root
+        if msg_type == FakeI3.GET_WORKSPACES:
+            with self.lock:
+                return self.get_workspaces()
+        if msg_type == FakeI3.SUBSCRIBE:
+            return {'success': True}
+        if msg_type == FakeI3.SEND_TICK:
+            self.tick(payload.decode())
+            return {'success': True}
+        if msg_type == FakeI3.GET_VERSION:
+            return {'major': 4, 'minor': 23, 'patch': 0,
+                    'human_readable': '4.23 (negwm fake)',
+                    'loaded_config_file_name': ''}
+        if msg_type == FakeI3.GET_CONFIG:
+            return {'config': ''}
+        if msg_type == FakeI3.SYNC:
+            return {'success': True}
+        return []
+
+    @staticmethod
+    def pack(msg_type: int, data: bytes) -> bytes:
+        return FakeI3.magic + FakeI3.header.pack(len(data), msg_type) + data
+
+    # Server
+
+    def start(self) -> 'FakeI3':
+        fake=self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                sock=self.request
+                while True:
+                    head=FakeI3.recv(sock, 14)
+                    if head is None:
+                        break
+                    length, msg_type=FakeI3.header.unpack(head[6:])
+                    payload=FakeI3.recv(sock, length) if length else b''
+                    data=json.dumps(fake.reply(msg_type, payload)).encode()
+                    msg=FakeI3.pack(msg_type, data)
+                    if msg_type == FakeI3.SUBSCRIBE:
+                        # Reply goes through the same queue as events, so the
+                        # client always gets it first.
+                        out=fake.subscribe(sock, set())
+                        out.put(msg)
+                        events=set(json.loads(payload.decode()))
+                        fake.subscribe(sock, events)
+                        if 'tick' in events: # like i3, first tick at once
+                            out.put(FakeI3.pack(
+                                FakeI3.events['tick'] | 1 << 31,
+                                json.dumps({'first': True, 'payload': ''}).encode()))
+                    elif sock in fake.subscribers:
+                        fake.subscribers[sock][1].put(msg)
+                    else:
+                        sock.sendall(msg)
+
+        self.server=socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self.server.daemon_threads=True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            os.unlink(self.path)
+            self.server=None
+
+    @staticmethod
+    def recv(sock, size: int) -> Optional[bytes]:
+        data=b''
+        while len(data) < size:
+            chunk=sock.recv(size - len(data))
+            if not chunk:
+                return None
+            data+=chunk
+        return data
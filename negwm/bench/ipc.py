@@ -0,0 +1,174 @@
+""" Command socket benchmark: starts MsgBroker with a small echo module on both the Unix socket and localhost TCP, then measures full
+request latency (connect, request, reply) as seen by a client like `negwm send`, and the framed protocol over one persistent connection:
+one request at a time and pipelined in batches. Reply encoding is compared with pickle, which was used before, on the same replies.
+Needs neither i3 nor X.
+
+Usage:
+    negwm-bench-ipc [-n N] [-d N] [-p PORT]
+
+Options:
+    -n, --ops=N             Requests per transport [default: 2000]
+    -d, --depth=N           Requests in flight for the pipelined run [default: 32]
+    -p, --port=PORT         TCP port to use [default: 15556] """
+
+import asyncio
+import os
+import pickle
+import socket
+import tempfile
+import threading
+import timeit
+from typing import Callable, Dict, List
+
+from docopt import docopt
+
+from negwm.bench.runner import Bench
+from negwm.lib.client import Client
+from negwm.lib.codec import Codec
+from negwm.lib.msgbroker import MsgBroker
+from negwm.lib.router import Router, command
+from negwm.lib.stats import Histogram
+from negwm.lib.transport import Transport
+
+
+class bench():
+    """ Module with replies shaped like the common real ones. """
+    def __init__(self) -> None:
+        self.tags=[f'tag{idx}' for idx in range(16)]
+        self.cfg={
+            tag: {'classw': [f'Class{idx}'], 'geom': '1000x800+10+10', 'prog': 'true'}
+            for idx, tag in enumerate(self.tags)
+        }
+        self.additional_props=[
+            {'mod': 'bench', 'tag': tag, 'prop': f'class=Class{idx}'}
+            for idx, tag in enumerate(self.tags[:4])
+        ]
+
+    @command()
+    def taglist(self) -> List:
+        return self.tags
+
+    @command()
+    def get_config(self) -> Dict:
+        return self.cfg
+
+    @command()
+    def get_added_props(self) -> List:
+        return self.additional_props
+
+
+class IpcBench():
+    def __init__(self, port: int) -> None:
+        os.environ['XDG_RUNTIME_DIR']=tempfile.mkdtemp(prefix='negwm-bench-ipc-')
+        self.port=port
+        router=Router()
+        mod=self.mod=bench()
+        router.add('bench', mod)
+        self.loop=asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(
+            MsgBroker.start({'bench': mod}, router, port),
+            self.loop).result()
+        self.results: Dict[str, Dict]={}
+
+    def unix(self) -> socket.socket:
+        sock=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(Transport.path())
+        return sock
+
+    def tcp(self) -> socket.socket:
+        return socket.create_connection(('localhost', self.port))
+
+    @staticmethod
+    def request(connect: Callable, message: bytes) -> bytes:
+        """ One request per connection, reply ends with connection close. """
+        sock=connect()
+        try:
+            sock.sendall(message)
+            chunks=[]
+            while True:
+                chunk=sock.recv(1 << 16)
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+        finally:
+            sock.close()
+
+    def measure(self, name: str, ops: int, func: Callable) -> None:
+        hist=Histogram()
+        start=timeit.default_timer()
+        for _ in range(ops):
+            op_start=timeit.default_timer()
+            func()
+            hist.add(timeit.default_timer() - op_start, 0)
+        self.report(name, hist, ops, timeit.default_timer() - start)
+
+    def framed(self, ops: int, depth: int) -> None:
+        """ Persistent framed connection: sequential and pipelined. """
+        async def run():
+            client=Client()
+            await client.connect()
+            for cmd in ('taglist', 'get_config'):
+                message=f'bench {cmd}'
+                hist=Histogram()
+                start=timeit.default_timer()
+                for _ in range(ops):
+                    op_start=timeit.default_timer()
+                    await client.request(message)
+                    hist.add(timeit.default_timer() - op_start, 0)
+                self.report(f'framed_{cmd}', hist, ops,
+                            timeit.default_timer() - start)
+                hist=Histogram()
+                start=timeit.default_timer()
+                for _ in range(ops // depth):
+                    op_start=timeit.default_timer()
+                    await asyncio.gather(
+                        *(client.request(message) for _ in range(depth)))
+                    hist.add((timeit.default_timer() - op_start) / depth, 0)
+                self.report(f'pipelined_{cmd}', hist, ops // depth * depth,
+                            timeit.default_timer() - start)
+            await client.close()
+        asyncio.run(run())
+
+    def codecs(self, ops: int) -> None:
+        """ Encode + decode of the common reply shapes. """
+        replies={
+            'taglist': self.mod.taglist(),
+            'get_config': self.mod.get_config(),
+            'get_added_props': self.mod.get_added_props(),
+        }
+        for name, reply in replies.items():
+            self.measure(f'pickle_{name}', ops,
+                         lambda: pickle.loads(pickle.dumps(reply)))
+            for encoding in Codec.encodings:
+                self.measure(
+                    f'{encoding}_{name}', ops,
+                    lambda: Codec.decode(Codec.encode(reply, encoding), encoding))
+
+    def report(self, name: str, hist: Histogram, ops: int, total: float) -> None:
+        report=hist.report()
+        del report['round_trips']
+        report['ops_per_sec']=round(ops / total, 1) if total else 0.0
+        self.results[name]=report
+
+    def run(self, ops: int, depth: int) -> Dict[str, Dict]:
+        for transport in ('unix', 'tcp'):
+            connect=getattr(self, transport)
+            for cmd in ('taglist', 'get_config'):
+                message=f'bench {cmd}\n'.encode()
+                self.measure(f'{transport}_{cmd}', ops,
+                             lambda: IpcBench.request(connect, message))
+        self.framed(ops, depth)
+        self.codecs(ops)
+        return self.results
+
+
+def main():
+    args=docopt(str(__doc__))
+    results=IpcBench(int(args['--port'])).run(
+        int(args['--ops']), int(args['--depth']))
+    Bench.compare(results, {}, 0.0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+""" Replay session recorded with `negwm --record FILE`. The fake i3 server serves the recorded tree snapshot, the recorded i3 events are
+sent in the original order and MsgBroker requests are dispatched between them. Commands sent by the modules change the served tree but do
+not produce events: the recorded ones already follow them, so the module code sees exactly the recorded event stream. Every record waits
+until its handlers are done, so the replay is deterministic, by default it also keeps the original timing.
+
+Modules use the current configs ($NEGWM_CFG or the default config dir) unless --cfg is given. Like negwm-bench it needs an X display.
+
+Usage:
+    negwm-replay [-m] [-s] [-n N] [-t PCT] [-b FILE] [-c DIR] LOG
+
+Options:
+    -m, --max               Replay at maximum speed instead of the original timing
+    -s, --save              Save results as the new baseline
+    -n, --session=N         Session to replay, the last one by default [default: -1]
+    -t, --threshold=PCT     Regression threshold in percents [default: 20]
+    -b, --baseline=FILE     Baseline file, LOG.baseline.json by default
+    -c, --cfg=DIR           negwm config dir to use """
+
+import inspect
+import sys
+import time
+import timeit
+from typing import Dict, List
+
+from docopt import docopt
+
+from negwm.bench.fake_i3 import FakeI3
+from negwm.bench.runner import Bench
+from negwm.lib.recorder import Recorder
+from negwm.lib.stats import Histogram
+
+
+class Replay():
+    def __init__(self, session: List, cfg_dir: str='') -> None:
+        """ session: records of one session, header and tree first. """
+        header, snapshot=session[0], session[1]
+        if snapshot[0] != 't':
+            raise ValueError('session has no tree snapshot')
+        # Records are written on completion, replay them in start order.
+        self.records=sorted(session[2:], key=lambda record: record[1])
+        fake=FakeI3(tree=snapshot[2]).start()
+        fake.command_events=False
+        self.bench=Bench(fake, header[2]['mods'], cfg_dir)
+
+    def run(self, max_speed: bool) -> Dict[str, Dict]:
+        bench=self.bench
+        router, events=bench.wm.router, bench.wm.events
+        bench.start()
+        hist, recorded=Histogram(), Histogram()
+        commands=0
+        first=self.records[0][1] if self.records else 0.0
+        start=timeit.default_timer()
+        for record in self.records:
+            kind, stamp=record[0], record[1]
+            if not max_speed:
+                delay=start + stamp - first - timeit.default_timer()
+                if delay > 0:
+                    time.sleep(delay)
+            op_start=timeit.default_timer()
+            if kind == 'e':
+                bench.fake.inject(record[2], record[3])
+                bench.settle()
+                recorded.add(record[4], 0)
+            elif kind == 'm':
+                args=record[2]
+                if args and args[0] != 'stats':
+                    ret=router.dispatch(args[0], args[1:])
+                    if inspect.isawaitable(ret):
+                        events.spawn(ret)
+                    bench.settle()
+                recorded.add(record[3], 0)
+            else:
+                if kind == 'c':
+                    commands+=1
+                continue
+            hist.add(timeit.default_timer() - op_start, 0)
+        total=timeit.default_timer() - start
+        report=hist.report()
+        del report['round_trips']
+        report['ops_per_sec']=round(hist.calls / total, 1) if total else 0.0
+        report['run_command']=bench.fake.counters.get(FakeI3.RUN_COMMAND, 0)
+        report['recorded_run_command']=commands
+        bench.results['replay']=report
+        original=recorded.report()
+        del original['round_trips']
+        bench.results['recorded']=original
+        bench.stop()
+        return bench.results
+
+
+def main():
+    args=docopt(str(__doc__))
+    sessions=Recorder.sessions(args['LOG'])
+    if not sessions:
+        sys.exit(f'No sessions in {args["LOG"]}')
+    try:
+        session=sessions[int(args['--session'])]
+    except IndexError:
+        sys.exit(f'There are {len(sessions)} sessions in {args["LOG"]}')
+    results=Replay(session, args['--cfg'] or '').run(args['--max'])
+    path=args['--baseline'] or f'{args["LOG"]}.baseline.json'
+    baseline=Bench.load_baseline(path)
+    print(f'recorded           p50 {results["recorded"]["p50"]:9}ms '
+          f'p95 {results["recorded"]["p95"]:9}ms')
+    regressed=Bench.compare(
+        {'replay': results['replay']}, baseline, float(args['--threshold']))
+    if args['--save']:
+        Bench.save_baseline(path, results)
+    elif regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
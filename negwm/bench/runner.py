@@ -0,0 +1,239 @@
+""" Benchmark runner: loads scratchpad, circle, lastgo, actions and configurator against the fake i3 IPC server and measures throughput and
+end-to-end latency of typical workloads. Each operation is considered done when the daemon has handled every i3 event it caused,
+including the events caused by its own commands. Results are compared with the stored baseline to make regressions visible.
+
+Modules still talk to X for screen resolution and EWMH window types, so an X display is needed: run it under Xvfb on headless machines.
+
+Usage:
+    negwm-bench [-s] [-w N] [-n N] [-t PCT] [-b FILE] [SCENARIO...]
+
+Options:
+    -s, --save              Save results as the new baseline
+    -w, --windows=N         Windows in the tree at startup [default: 500]
+    -n, --ops=N             Operations per scenario [default: 200]
+    -t, --threshold=PCT     Regression threshold in percents [default: 20]
+    -b, --baseline=FILE     Baseline file [default: ~/.cache/negwm/bench.json]
+
+Scenarios: startup, restore, circle_next, scratchpad_toggle, lastgo_switch, configurator. All of them are run by default. """
+
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from typing import Callable, Dict
+
+from docopt import docopt
+
+from negwm.bench.fake_i3 import FakeI3
+from negwm.lib.extension import extension
+from negwm.lib.msgbroker import MsgBroker
+from negwm.lib.stats import Histogram, Stats
+
+
+class Bench():
+    mods=('scratchpad', 'circle', 'lastgo', 'actions', 'configurator')
+    # Window classes cycled over the synthetic session
+    classes=('Term', 'Web', 'App', 'App', 'Term', 'App', 'Web', 'App', 'App', 'IM')
+    configs={
+        'circle': """
+term: {classw: [Term], prog: 'true', ws: term}
+web: {classw: [Web], prog: 'true', ws: web}
+dev: {class_r: ['^Dev.*'], prog: 'true'}
+""",
+        'scratchpad': """
+im:
+  classw: [IM]
+  geom: 1088x1390+2359+1
+  prog: 'true'
+music:
+  instance: [music]
+  geom: 1932x590+674+765
+  prog: 'true'
+""",
+        'lastgo': "autoback: ['3']\n",
+        'actions': """
+cache_list_size: 10
+grow_coeff: 1.01
+shrink_coeff: 0.99
+x2_use_gaps: 1
+useless_gaps: {a: 12, d: 12, s: 12, w: 12}
+""",
+        'configurator': """
+workspaces: [' 1:term', ' 2:web', ' 3:dev']
+default:
+  state: {bind: '', name: ''}
+  binds:
+  - Mod4+q: fullscreen toggle
+    Mod4+Escape: kill
+""",
+    }
+    scenarios=(
+        'startup', 'restore', 'circle_next', 'scratchpad_toggle',
+        'lastgo_switch', 'configurator',
+    )
+
+    def __init__(self, fake: FakeI3, mods, cfg_dir: str='') -> None:
+        """ fake: started fake i3 server.
+            mods: modules to load.
+            cfg_dir: negwm config dir, $NEGWM_CFG is kept as is by default. """
+        self.fake=fake
+        if cfg_dir:
+            os.environ['NEGWM_CFG']=cfg_dir
+        os.environ['I3SOCK']=fake.path
+        # Imported here: the config dir and i3 socket should be set first.
+        from negwm.main import NegWM
+        self.wm=NegWM()
+        self.wm.mods={mod: None for mod in mods}
+        MsgBroker.mods=self.wm.mods
+        self.ticks=threading.Condition()
+        self.last_tick=''
+        self.seq=itertools.count()
+        self.wm.events.on('tick', self.on_tick)
+        self.results: Dict[str, Dict]={}
+
+    @staticmethod
+    def synthetic(windows: int) -> 'Bench':
+        """ Bench against the synthetic session with the given number of
+        windows and generated module configs. """
+        fake=FakeI3().start()
+        for idx in range(windows):
+            fake.add_window(
+                Bench.classes[idx % len(Bench.classes)],
+                ws=idx % len(fake.workspaces) + 1, emit=False)
+        cfg_dir=tempfile.mkdtemp(prefix='negwm-bench-cfg-')
+        for mod, text in Bench.configs.items():
+            with open(f'{cfg_dir}/{mod}.cfg', 'w', encoding='utf8') as fp:
+                fp.write(text.lstrip())
+        return Bench(fake, Bench.mods, cfg_dir)
+
+    def on_tick(self, _, event) -> None:
+        with self.ticks:
+            self.last_tick=event.payload
+            self.ticks.notify_all()
+
+    def settle(self) -> None:
+        """ Wait until negwm handled every event sent so far and its handlers
+        caused no new ones. """
+        while True:
+            before=self.fake.emitted
+            payload=f'negwm-bench-{next(self.seq)}'
+            with self.ticks:
+                self.fake.tick(payload)
+                if not self.ticks.wait_for(
+                        lambda: self.last_tick == payload, timeout=10):
+                    raise TimeoutError('negwm does not handle i3 events')
+            if self.fake.emitted == before:
+                return
+
+    def measure(self, name: str, ops: int, func: Callable, settle=True) -> None:
+        hist=Histogram()
+        counters=dict(self.fake.counters)
+        start=timeit.default_timer()
+        for idx in range(ops):
+            op_start=timeit.default_timer()
+            func(idx)
+            if settle:
+                self.settle()
+            hist.add(timeit.default_timer() - op_start, 0)
+        total=timeit.default_timer() - start
+        report=hist.report()
+        del report['round_trips']
+        report['ops_per_sec']=round(ops / total, 1) if total else 0.0
+        for key in (FakeI3.RUN_COMMAND, FakeI3.GET_TREE):
+            delta=self.fake.counters.get(key, 0) - counters.get(key, 0)
+            report[FakeI3.stats_name(key)]=round(delta / ops, 2)
+        self.results[name]=report
+
+    def start(self) -> None:
+        """ Load modules (measured as startup) and start handling events. """
+        wm=self.wm
+        threading.Thread(target=wm.loop.run_forever, daemon=True).start()
+        self.measure('startup', 1, lambda _: wm.load_modules(), settle=False)
+        threading.Thread(target=wm.i3.main, daemon=True).start()
+        while not self.fake.subscribed('tick'):
+            time.sleep(0.01)
+        self.settle()
+
+    def stop(self) -> None:
+        self.results['handlers']=Stats.report()
+        self.wm.i3.main_quit()
+        self.fake.stop()
+
+    def run(self, scenarios, ops: int) -> Dict[str, Dict]:
+        wm, fake=self.wm, self.fake
+        self.start()
+        plan={
+            'restore': lambda idx: fake.add_window(
+                Bench.classes[idx % len(Bench.classes)]),
+            'circle_next': lambda _: fake.binding('nop circle next term'),
+            'scratchpad_toggle': lambda _: fake.binding('nop scratchpad toggle im'),
+            'lastgo_switch': lambda _: fake.binding('nop lastgo switch'),
+            'configurator': lambda _: extension.get_mod('configurator').generate_config(),
+        }
+        for name in Bench.scenarios[1:]:
+            if name in scenarios:
+                self.measure(name, ops, plan[name])
+        if 'startup' not in scenarios:
+            del self.results['startup']
+        self.stop()
+        return self.results
+
+    @staticmethod
+    def load_baseline(path: str) -> Dict:
+        if not os.path.isfile(path):
+            return {}
+        with open(path, encoding='utf8') as fp:
+            return json.load(fp)
+
+    @staticmethod
+    def save_baseline(path: str, results: Dict) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf8') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+        print(f'Baseline saved to {path}')
+
+    @staticmethod
+    def compare(results: Dict, baseline: Dict, threshold: float) -> bool:
+        """ Print results against baseline, returns True on regression. """
+        regressed=False
+        for name, res in results.items():
+            base=baseline.get(name)
+            if name == 'handlers':
+                continue
+            if not base:
+                print(f'{name:18} p50 {res["p50"]:9}ms p95 {res["p95"]:9}ms '
+                      f'{res["ops_per_sec"]:9} ops/s')
+                continue
+            slower=res['p95'] > base['p95'] * (1 + threshold / 100)
+            fewer=res['ops_per_sec'] < base['ops_per_sec'] * (1 - threshold / 100)
+            mark='REGRESSION' if slower or fewer else ''
+            regressed=regressed or bool(mark)
+            print(f'{name:18} p50 {res["p50"]:9}ms p95 {res["p95"]:9}ms '
+                  f'(base {base["p95"]}ms) {res["ops_per_sec"]:9} ops/s '
+                  f'(base {base["ops_per_sec"]}) {mark}')
+        return regressed
+
+
+def main():
+    args=docopt(str(__doc__))
+    scenarios=args['SCENARIO'] or list(Bench.scenarios)
+    unknown=set(scenarios) - set(Bench.scenarios)
+    if unknown:
+        sys.exit(f'Unknown scenarios: {" ".join(sorted(unknown))}')
+    bench=Bench.synthetic(int(args['--windows']))
+    results=bench.run(scenarios, int(args['--ops']))
+    path=os.path.expanduser(args['--baseline'])
+    regressed=Bench.compare(
+        results, Bench.load_baseline(path), float(args['--threshold']))
+    if args['--save']:
+        Bench.save_baseline(path, results)
+    elif regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
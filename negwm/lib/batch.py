@@ -0,0 +1,138 @@
+""" Command batcher. Collects i3 commands of one logical user action into a single `[con_id=X] cmd; [con_id=Y] cmd` chain and sends it
+as one RUN_COMMAND message instead of one blocking round trip (and possible relayout) per window. """
+
+import asyncio
+import logging
+import threading
+from typing import List, Tuple
+
+
+class CommandBatch():
+    """ Usage:
+        with self.batch() as batch:
+            batch.win(win, 'move scratchpad')
+            batch.add('[id=42] focus')
+    Nested `with` blocks on the same thread reuse the outer batch, so helper methods can batch on their own and still be merged into the
+    caller's action. The message is sent when the outermost block exits.
+    In the asyncio runtime the outermost block only queues the commands on the loop thread: the dispatcher sends them on the aio connection
+    and waits for the reply right after the handler or socket command returns, see Dispatcher.drain. Any blocking i3 request made before
+    that sends them first on its own connection, so a read which follows a batch always sees its result and direct con.command() calls
+    never overtake it. """
+    local=threading.local()
+    messages=0  # RUN_COMMAND messages sent by batches
+    commands=0  # logical commands sent inside them
+    deferred=False # asyncio runtime: queue commands on the loop thread
+    pending: List[str]=[] # queued commands, in order
+
+    def __init__(self, i3) -> None:
+        self.i3ipc=i3
+        self.cmds: List[str]=[]
+        self.results: List[Tuple[str, bool]]=[]
+        self.depth=0
+
+    @staticmethod
+    def current(i3) -> 'CommandBatch':
+        """ Return active batch of this thread or create the new one. """
+        batch=getattr(CommandBatch.local, 'batch', None)
+        if batch is None:
+            batch=CommandBatch(i3)
+        return batch
+
+    def __enter__(self) -> 'CommandBatch':
+        if not self.depth:
+            CommandBatch.local.batch=self
+        self.depth+=1
+        return self
+
+    def __exit__(self, exc_type, *_) -> None:
+        """ Outermost block sends the batch. When an exception propagates the
+        action is incomplete, so nothing is sent to i3. """
+        self.depth-=1
+        if not self.depth:
+            CommandBatch.local.batch=None
+            if exc_type is not None:
+                if self.cmds:
+                    logging.warning(
+                        f'batch: dropped {len(self.cmds)} commands on error')
+                self.cmds=[]
+                return
+            self.flush()
+
+    def add(self, cmd: str) -> None:
+        cmd=cmd.strip()
+        if cmd:
+            self.cmds.append(cmd)
+
+    def win(self, win, cmd: str) -> None:
+        """ Add command for the given container. """
+        if cmd.strip():
+            self.add(f'[con_id="{win.id}"] {cmd}')
+
+    @staticmethod
+    def count(cmd: str) -> int:
+        """ Number of replies i3 sends for the command: one per each ',' or
+        ';' separated part outside of quotes. """
+        ret, quoted=1, False
+        for char in cmd:
+            if char == '"':
+                quoted=not quoted
+            elif char in {',', ';'} and not quoted:
+                ret+=1
+        return ret
+
+    def flush(self) -> List[Tuple[str, bool]]:
+        """ Send all collected commands as one message. Returns the list of
+        (command, success) pairs, failures are logged. Empty when the
+        commands are queued for the dispatcher. """
+        cmds, self.cmds=self.cmds, []
+        self.results=[]
+        if not cmds:
+            return self.results
+        CommandBatch.messages+=1
+        CommandBatch.commands+=len(cmds)
+        if CommandBatch.deferred:
+            try:
+                asyncio.get_running_loop()
+                CommandBatch.pending.extend(cmds)
+                return self.results
+            except RuntimeError: # not on the loop thread
+                pass
+        self.results=CommandBatch.check(cmds, self.i3ipc.command('; '.join(cmds)))
+        return self.results
+
+    @staticmethod
+    def take() -> List[str]:
+        """ Queued commands, the queue is emptied. """
+        cmds, CommandBatch.pending=CommandBatch.pending, []
+        return cmds
+
+    @staticmethod
+    def send_pending(i3) -> None:
+        """ Send queued commands on the blocking connection, before a
+        blocking request which should see their result. """
+        cmds=CommandBatch.take()
+        if cmds:
+            CommandBatch.check(cmds, i3.command('; '.join(cmds)))
+
+    @staticmethod
+    def check(cmds: List[str], replies) -> List[Tuple[str, bool]]:
+        """ Split replies of the chain between its commands. """
+        ret=[]
+        pos=0
+        for cmd in cmds:
+            part=replies[pos:pos + CommandBatch.count(cmd)]
+            pos+=len(part)
+            success=bool(part) and all(reply.success for reply in part)
+            if not success:
+                errors=[reply.error for reply in part if reply.error]
+                logging.error(f'i3 command failed: {cmd} {errors}')
+            ret.append((cmd, success))
+        return ret
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'messages': CommandBatch.messages,
+            'commands': CommandBatch.commands,
+            'saved': CommandBatch.commands - CommandBatch.messages,
+        }
@@ -2,16 +2,22 @@
 This is a superclass for negwm which want to store configuration via hy files. It supports inotify-based updating of self.cfg dynamically
 and has pretty simple API. I've considered that inheritance here is good idea. """
 
+import io
 import sys
 import traceback
 import logging
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Set, Tuple
 import ruamel.yaml as yaml
+from negwm.lib.cfg_cache import CfgCache
+from negwm.lib.cfg_persister import CfgPersister
+from negwm.lib.cfg_watcher import ConfigWatcher
 from negwm.lib.misc import Misc
+from negwm.lib.publisher import Publisher
 from negwm.lib.extension import extension
+from negwm.lib.router import command
 
 
-class NewLineDumper(yaml.Dumper):
+class NewLineEmitter(yaml.emitter.Emitter):
     # HACK: insert blank lines between top-level objects
     # inspired by https://stackoverflow.com/a/44284819/3786245
     def write_line_break(self, data=None):
@@ -21,6 +27,8 @@ class NewLineDumper(yaml.Dumper):
 
 
 class cfg():
+    generation=0 # bumped on every config change, derived data is dropped
+
     def __init__(self, i3) -> None:
         self.mod=self.__class__.__name__    # detect current extension
         self.cfg_path=f'{Misc.cfg_path()}/{self.mod}.cfg'
@@ -30,7 +38,17 @@ class cfg():
         if not self.cfg: self.cfg={}
         self.i3ipc=i3
 
+    @classmethod
+    def from_config(cls):
+        """ Module instance with config loaded only, without i3 connection
+        and any module state: enough to generate i3 config ahead of time. """
+        mod=cls.__new__(cls)
+        cfg.__init__(mod, None)
+        return mod
+
+    @command()
     def get_config(self) -> Dict: return self.cfg
+    @command()
     def get_added_props(self) -> List: return self.additional_props
 
     def conf(self, *conf_path) -> Any:
@@ -45,16 +63,39 @@ class cfg():
                 return ret
         return ret
 
+    @staticmethod
+    def changed_tags(prev_conf, conf) -> Set[str]:
+        """ Top-level config keys added, removed or changed. """
+        prev_conf, conf=prev_conf or {}, conf or {}
+        return {
+            tag for tag in set(prev_conf) | set(conf)
+            if prev_conf.get(tag) != conf.get(tag)
+        }
+
+    def reconfigure(self, changed: Set[str]) -> None:
+        """ Apply the reloaded config. Modules with per-tag state override it
+        to rebuild only the changed tags, by default module is reinitialized.
+        Event subscriptions are replaced, not duplicated, see extension.on.
+            changed: config keys added, removed or changed. """
+        self.__init__(self.i3ipc)
+
+    @command()
     def reload(self, *_) -> None:
         """ Reload config for current selected module. Call load_config, print
-        debug messages and reinit all stuff. """
+        debug messages and reinit the parts affected by the change. """
         prev_conf=self.cfg
         try:
             self.load_config()
-            self.__init__(self.i3ipc)
-            extensions=extension.get_mods()
-            if 'configurator' in extensions:
-                getattr(extensions['configurator'], 'write')()
+            if not self.cfg: self.cfg={}
+            changed=cfg.changed_tags(prev_conf, self.cfg)
+            if not changed:
+                logging.info(f"[{self.mod}] config not changed")
+                return
+            self.reconfigure(changed)
+            if 'configurator' in extension.get_mods():
+                extension.update_i3_config()
+            Publisher.emit('config', {'mod': self.mod})
+            Publisher.check()
             logging.info(f"[{self.mod}] config reloaded")
             print(f"[{self.mod}] config reloaded")
         except Exception:
@@ -64,18 +105,58 @@ class cfg():
             self.__init__(*_)
 
     def load_config(self) -> None:
-        """ Reload config """
+        """ Reload config as plain dicts and lists via the compiled config
+        cache. Content hash is remembered, so the config watcher does not
+        reload the same content again. """
+        self.cfg_digest=None # content loaded, see CfgPersister.documents
         try:
-            y=yaml.YAML(typ='rt')
-            y.preserve_quotes=True
-            with open(self.cfg_path, "r") as mod_cfg:
-                self.cfg=y.load(mod_cfg)
+            self.cfg, digest=CfgCache.load(self.cfg_path)
+            ConfigWatcher.digests[self.cfg_path]=digest
+            self.cfg_digest=digest
         except FileNotFoundError:
             logging.error(f'file {self.cfg_path} not exists')
+        self.config_changed()
+
+    def config_changed(self) -> None:
+        """ Drop data derived from module configs, like compiled match
+        rules. Called after load and after in-place changes. """
+        cfg.generation+=1
+
+    @staticmethod
+    def merge(doc, data):
+        """ Apply plain config data to the round-trip document, so comments,
+        quotes and styles of the unchanged parts survive the dump. """
+        if isinstance(doc, dict) and isinstance(data, dict):
+            for key in [key for key in doc if key not in data]:
+                del doc[key]
+            for key, value in data.items():
+                doc[key]=cfg.merge(doc[key], value) if key in doc else value
+            return doc
+        return doc if doc == data else data
+
+    def serialize_config(self, conf, document) -> Tuple[Any, bytes]:
+        """ Render config snapshot as YAML merged into the round-trip
+        document, which is loaded from the file here when it is None, to
+        keep the comments. Returns the updated document and the text. Runs
+        on the persister thread, which owns the documents. """
+        if document is None:
+            try:
+                y=yaml.YAML(typ='rt')
+                y.preserve_quotes=True
+                with open(self.cfg_path, "r") as mod_cfg:
+                    document=y.load(mod_cfg)
+            except FileNotFoundError:
+                document=None
+        document=cfg.merge(document, conf)
+        y=yaml.YAML(typ='rt')
+        y.allow_unicode=True
+        y.Emitter=NewLineEmitter
+        y.width=140
+        buf=io.StringIO()
+        y.dump(document, buf)
+        return document, buf.getvalue().encode()
 
     def dump_config(self) -> None:
-        """ Dump current config, can be used for debugging. """
-        with open(self.cfg_path, "w+") as mod_cfg:
-            y=yaml.YAML(typ='rt')
-            y.allow_unicode=True
-            y.dump(self.cfg, mod_cfg, Dumper=NewLineDumper, width=140)
+        """ Persist current config. Written in background by CfgPersister,
+        the write does not make negwm reload the module. """
+        CfgPersister.schedule(self)
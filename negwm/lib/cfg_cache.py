@@ -0,0 +1,66 @@
+""" Compiled module configs. Round-trip YAML parsing is slow, so configs are parsed with the safe loader into plain dicts and lists, and the
+result is marshalled to $XDG_CACHE_HOME/negwm/cfg/<module>.marshal together with the file mtime, size and content hash. Unchanged config is
+loaded from there without YAML parsing at all. """
+
+import hashlib
+import logging
+import marshal
+import os
+import tempfile
+from typing import Any, Tuple
+
+import ruamel.yaml as yaml
+
+from negwm.lib.startup_cache import StartupCache
+
+
+class CfgCache():
+    version=1 # bump when the cached layout changes
+
+    @staticmethod
+    def path(cfg_path: str) -> str:
+        name=os.path.basename(cfg_path).removesuffix('.cfg')
+        return f'{os.path.dirname(StartupCache.path())}/cfg/{name}.marshal'
+
+    @staticmethod
+    def read(path: str):
+        try:
+            with open(path, 'rb') as fp:
+                entry=marshal.load(fp)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(entry, tuple) or len(entry) != 5 or \
+                entry[0] != CfgCache.version:
+            return None
+        return entry
+
+    @staticmethod
+    def write(path: str, entry: Tuple) -> None:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp=tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as fp:
+                marshal.dump(entry, fp)
+            os.replace(tmp, path)
+        except (OSError, ValueError) as err:
+            logging.error(f'Cannot write config cache {path}: {err}')
+
+    @staticmethod
+    def load(cfg_path: str) -> Tuple[Any, str]:
+        """ Returns (config, content hash). Raises FileNotFoundError when
+        config does not exist. """
+        st=os.stat(cfg_path)
+        cache_path=CfgCache.path(cfg_path)
+        entry=CfgCache.read(cache_path)
+        if entry is not None and entry[1:3] == (st.st_mtime_ns, st.st_size):
+            return entry[4], entry[3]
+        with open(cfg_path, 'rb') as fp:
+            data=fp.read()
+        digest=hashlib.sha1(data).hexdigest()
+        if entry is not None and entry[3] == digest:
+            conf=entry[4] # touched, but not changed
+        else:
+            conf=yaml.YAML(typ='safe').load(data.decode())
+        CfgCache.write(cache_path, (
+            CfgCache.version, st.st_mtime_ns, st.st_size, digest, conf))
+        return conf, digest
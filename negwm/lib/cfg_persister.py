@@ -0,0 +1,89 @@
+""" Write-behind persister for module configs. dump_config only takes a snapshot of the module config and marks it dirty, the background
+thread writes dirty configs at most once per interval via temporary file plus rename, so i3 event handling never waits for the disk. The
+written content is remembered by the config watcher before the rename, so it does not reload the module. Round-trip documents, which keep
+comments of the config files, are owned by the persister: they are used only under its write lock and dropped when the module loaded
+another file content since. """
+
+import copy
+import logging
+import os
+import tempfile
+import threading
+import time
+import timeit
+from typing import Dict, Tuple
+
+from negwm.lib.cfg_watcher import ConfigWatcher
+
+
+class CfgPersister():
+    interval=0.5 # seconds between flushes
+    cond=threading.Condition()
+    write_lock=threading.Lock() # keeps older snapshot from overwriting newer
+    dirty: Dict[str, Tuple]={} # config path -> (module, config snapshot, loaded digest)
+    documents: Dict[str, Tuple]={} # config path -> (loaded digest, round-trip document)
+    thread=None
+    last_flush=0.0
+
+    @staticmethod
+    def schedule(mod) -> None:
+        """ Persist module config later. Repeated calls before the flush are
+        coalesced into one write of the latest snapshot. """
+        snapshot=copy.deepcopy(mod.cfg)
+        digest=getattr(mod, 'cfg_digest', None)
+        with CfgPersister.cond:
+            CfgPersister.dirty[mod.cfg_path]=(mod, snapshot, digest)
+            if CfgPersister.thread is None:
+                CfgPersister.thread=threading.Thread(
+                    target=CfgPersister.worker, daemon=True,
+                    name='cfg-persister')
+                CfgPersister.thread.start()
+            CfgPersister.cond.notify()
+
+    @staticmethod
+    def worker() -> None:
+        while True:
+            with CfgPersister.cond:
+                CfgPersister.cond.wait_for(lambda: CfgPersister.dirty)
+            delay=CfgPersister.last_flush + CfgPersister.interval - \
+                timeit.default_timer()
+            if delay > 0:
+                time.sleep(delay)
+            CfgPersister.flush()
+
+    @staticmethod
+    def flush() -> None:
+        """ Write all dirty configs now, called on shutdown as well. """
+        with CfgPersister.write_lock:
+            with CfgPersister.cond:
+                dirty=CfgPersister.dirty
+                CfgPersister.dirty={}
+                CfgPersister.last_flush=timeit.default_timer()
+            for path, (mod, snapshot, digest) in dirty.items():
+                loaded, document=CfgPersister.documents.pop(path, (None, None))
+                if loaded != digest: # reloaded from other content since
+                    document=None
+                try:
+                    document, data=mod.serialize_config(snapshot, document)
+                    CfgPersister.documents[path]=(digest, document)
+                    CfgPersister.write(path, data)
+                except Exception:
+                    logging.exception(f'Cannot write config {path}')
+
+    @staticmethod
+    def write(path: str, data: bytes) -> None:
+        """ Atomic replace, temporary file name does not look like config,
+        so the config watcher sees only the final rename. """
+        fd, tmp=tempfile.mkstemp(
+            dir=os.path.dirname(path),
+            prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            if os.path.exists(path):
+                os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+            ConfigWatcher.remember(path, data)
+            os.replace(tmp, path)
+        except OSError:
+            os.unlink(tmp)
+            raise
@@ -0,0 +1,86 @@
+""" Debounced watcher for module configs. Editors save with several writes or with write to temporary file plus rename, negwm dumps configs
+on its own: the watcher waits until the burst is over, then reports only the modules whose config content differs from what negwm loaded
+or wrote last time. """
+
+import asyncio
+import hashlib
+import logging
+from typing import Callable, Dict, List, Optional, Set
+
+from asyncinotify import Inotify, Mask
+
+
+class ConfigWatcher():
+    debounce=0.2 # seconds of quiet after the last event
+    suffix='.cfg'
+    digests: Dict[str, str]={} # config path -> content hash known to negwm
+
+    def __init__(self, path: str, mods, callback: Callable[[List[str]], None]) -> None:
+        """ path: config directory.
+            mods: module names to watch.
+            callback: called with the list of changed modules. """
+        self.path=path
+        self.mods=mods
+        self.callback=callback
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha1(data).hexdigest()
+
+    @staticmethod
+    def remember(path: str, data: bytes) -> None:
+        """ Content negwm loaded or wrote itself, it does not trigger reload. """
+        ConfigWatcher.digests[path]=ConfigWatcher.digest(data)
+
+    def file_digest(self, mod: str) -> Optional[str]:
+        try:
+            with open(f'{self.path}/{mod}{ConfigWatcher.suffix}', 'rb') as fp:
+                return ConfigWatcher.digest(fp.read())
+        except OSError:
+            return None
+
+    def changed(self, mods: Set[str]) -> List[str]:
+        ret=[]
+        for mod in sorted(mods):
+            path=f'{self.path}/{mod}{ConfigWatcher.suffix}'
+            digest=self.file_digest(mod)
+            if digest is None or digest == ConfigWatcher.digests.get(path):
+                continue
+            ConfigWatcher.digests[path]=digest
+            ret.append(mod)
+        return ret
+
+    def module(self, event) -> Optional[str]:
+        name=str(event.name or '')
+        if not name.endswith(ConfigWatcher.suffix):
+            return None
+        mod=name.removesuffix(ConfigWatcher.suffix)
+        return mod if mod in self.mods else None
+
+    async def run(self) -> None:
+        while True:
+            with Inotify() as inotify:
+                inotify.add_watch(
+                    f'{self.path}/', Mask.CLOSE_WRITE | Mask.MOVED_TO)
+                while True:
+                    pending=set()
+                    mod=self.module(await inotify.get())
+                    if mod is not None:
+                        pending.add(mod)
+                    while True:
+                        try:
+                            event=await asyncio.wait_for(
+                                inotify.get(), ConfigWatcher.debounce)
+                        except asyncio.TimeoutError:
+                            break
+                        mod=self.module(event)
+                        if mod is not None:
+                            pending.add(mod)
+                    changed=self.changed(pending)
+                    if not changed:
+                        continue
+                    logging.info(f'config changed: {" ".join(changed)}')
+                    try:
+                        self.callback(changed)
+                    except Exception:
+                        logging.exception('config reload failed')
@@ -1,9 +1,11 @@
 """ NegWM health-checker """
+import hashlib
 import os
-import subprocess
 import shutil
 import logging
+import threading
 from negwm.lib.misc import Misc
+from negwm.lib.startup_cache import StartupCache
 
 class checker():
     @staticmethod
@@ -43,8 +45,6 @@ class checker():
     @staticmethod
     def check_i3_config(cfg='config') -> bool:
         logging.info('Checking i3 config consistency')
-        
-        subprocess.check_output(["i3-config-wizard", "-m", "win"])
         current_i3_config = Misc.current_i3_cfg()
         if not (os.path.isfile(current_i3_config) and \
                 os.path.getsize(current_i3_config) > 0):
@@ -76,9 +76,33 @@ class checker():
                     '.zshenv or /etc/profile')
 
     @staticmethod
-    def check():
-        """ Checking various dependencies """
-        logging.basicConfig(level=logging.ERROR)
+    def fingerprint():
+        """ Key of the cached check results: i3 binary mtime, i3 config
+        content hash and $PATH. None when i3 config is not known yet. """
+        i3_bin = shutil.which('i3')
+        i3_cfg = StartupCache.get('i3_cfg', '')
+        if not i3_bin or not i3_cfg or not os.path.isfile(i3_cfg):
+            return None
+        with open(i3_cfg, 'rb') as fp:
+            cfg_hash = hashlib.sha1(fp.read()).hexdigest()
+        return f'{os.stat(i3_bin).st_mtime_ns}:{cfg_hash}:{os.environ.get("PATH", "")}'
+
+    @staticmethod
+    def run_checks(key) -> None:
         checker.check_env()
         checker.check_for_executable_deps()
-        checker.check_i3_config()
+        if checker.check_i3_config():
+            StartupCache.set('checks', key or checker.fingerprint())
+
+    @staticmethod
+    def check():
+        """ Checking various dependencies. Nothing is checked when i3 binary,
+        i3 config and $PATH are the same as for the last successful check,
+        otherwise checks run in background. """
+        logging.basicConfig(level=logging.ERROR)
+        key = checker.fingerprint()
+        if key is not None and StartupCache.get('checks') == key:
+            logging.info('Startup checks are cached [OK]')
+        else:
+            threading.Thread(
+                target=checker.run_checks, args=(key,), daemon=True).start()
@@ -0,0 +1,106 @@
+""" Client of the negwm command socket using the framed protocol: one persistent connection per asyncio loop, requests can be pipelined
+and replies are matched by request id, so concurrent callers do not wait for each other's replies. """
+
+import asyncio
+import itertools
+from typing import AsyncIterator, Dict, Optional
+
+from negwm.lib.codec import Codec
+from negwm.lib.transport import Frame, Transport
+
+
+class Client():
+    clients: Dict[int, 'Client']={} # id(loop) -> client
+
+    def __init__(self) -> None:
+        self.reader=self.writer=None
+        self.ids=itertools.count(1)
+        self.pending: Dict[int, asyncio.Future]={}
+        self.streams: Dict[int, asyncio.Queue]={} # subscribe request id -> queue
+        self.task: Optional[asyncio.Task]=None
+        self.loop=None
+        self.encoding=Codec.name # reply encoding negotiated on connect
+
+    @staticmethod
+    async def shared() -> 'Client':
+        """ Connected client of the running loop. """
+        loop=asyncio.get_running_loop()
+        client=Client.clients.get(id(loop))
+        if client is None or client.loop is not loop or client.writer is None:
+            client=Client()
+            await client.connect()
+            Client.clients[id(loop)]=client
+        return client
+
+    async def connect(self, timeout: float=0.0) -> None:
+        self.reader, self.writer=await Transport.connect(timeout)
+        self.writer.write(Frame.hello_line(Codec.encodings))
+        answer=Frame.parse_hello(await self.reader.readline())
+        if not answer or answer[0] not in Codec.encodings:
+            self.writer.close()
+            self.writer=None
+            raise ConnectionError(f'negwm reply encoding is not supported: {answer}')
+        self.encoding=answer[0]
+        self.loop=asyncio.get_running_loop()
+        self.task=self.loop.create_task(self.read_replies())
+
+    async def read_replies(self) -> None:
+        try:
+            while True:
+                req_id, payload=await Frame.read(self.reader)
+                stream=self.streams.get(req_id)
+                if stream is not None:
+                    stream.put_nowait(Codec.decode(payload, self.encoding))
+                    continue
+                future=self.pending.pop(req_id, None)
+                if future is not None and not future.done():
+                    future.set_result(payload)
+        except (asyncio.IncompleteReadError, ConnectionError) as err:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(str(err)))
+            self.pending.clear()
+            for stream in self.streams.values():
+                stream.put_nowait(None)
+            self.writer=None
+
+    async def request(self, message: str):
+        """ Send command line, returns decoded reply, None for no result.
+        Replies of any size are read in full. """
+        if self.writer is None:
+            raise ConnectionError('not connected to negwm')
+        req_id=next(self.ids)
+        future=asyncio.get_running_loop().create_future()
+        self.pending[req_id]=future
+        self.writer.write(Frame.pack(req_id, message.strip().encode()))
+        await self.writer.drain()
+        payload=await future
+        return Codec.decode(payload, self.encoding) if payload else None
+
+    async def subscribe(self, *topics: str) -> AsyncIterator[Dict]:
+        """ Yield change notifications of the topics: module names and
+        `config`. Module state comes first, then the changes, see Publisher.
+        Ends when the connection is closed. """
+        if self.writer is None:
+            raise ConnectionError('not connected to negwm')
+        req_id=next(self.ids)
+        stream=self.streams[req_id]=asyncio.Queue()
+        self.writer.write(Frame.pack(
+            req_id, ' '.join(('subscribe',) + topics).encode()))
+        await self.writer.drain()
+        try:
+            while True:
+                message=await stream.get()
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.streams.pop(req_id, None)
+
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer=None
@@ -0,0 +1,280 @@
+""" Single subscription point for i3 events. NegWM owns one Dispatcher, modules subscribe through extension.on() and the dispatcher fans
+events out to them in subscription order. The same handlers work with the threaded runtime (blocking i3ipc.Connection.main on the main
+thread) and with the asyncio runtime, where events come from i3ipc.aio on the loop shared with MsgBroker and the config watchers.
+
+In the asyncio runtime events are handled one at a time in arrival order and coroutine handlers are awaited in place: while a handler waits
+for i3 the loop serves socket clients and config watchers, and the next handlers still see its result. The tree cache refresh and command
+batches go through the aio connection this way: batches queued by a handler are sent and their replies awaited before the next handler
+is called, see TreeCache.refresh and CommandBatch. In the threaded runtime coroutines returned by handlers are run to completion on the
+event thread, so module state is never touched from the loop thread. """
+
+import asyncio
+import functools
+import inspect
+import logging
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+import i3ipc
+import i3ipc.aio
+
+from negwm.lib.batch import CommandBatch
+from negwm.lib.publisher import Publisher
+from negwm.lib.recorder import Recorder
+from negwm.lib.stats import Stats
+
+
+class Dispatcher():
+    # Events with containers inside. In the asyncio runtime they are rebuilt
+    # against the blocking connection for plain (non-coroutine) handlers, so
+    # win.command() keeps working in the old synchronous module code.
+    sync_events={
+        'window': i3ipc.WindowEvent,
+        'workspace': i3ipc.WorkspaceEvent,
+    }
+
+    def __init__(self, i3, loop) -> None:
+        """ i3: blocking i3ipc connection.
+            loop: asyncio loop used by MsgBroker and config watchers. """
+        self.i3ipc=i3
+        self.loop=loop
+        self.aio=None # i3ipc.aio connection, asyncio runtime only
+        self.pending=None # asyncio runtime: events waiting for the pump
+        self.aio_lock=None # one request at a time on the aio command socket
+        self.handlers: Dict[str, List[Tuple[str, Callable, Tuple]]]={}
+
+    def on(self, event: str, handler: Callable) -> Tuple:
+        """ Subscribe handler to the i3 event, detailed events like
+        window::new are supported. Handler may be a coroutine function.
+        Returns subscription handle: subscribing the same module method to
+        the same event again replaces the old subscription in place, so
+        module reinitialization on reload does not add handler copies. """
+        base, _, detail=event.replace('-', '_').partition('::')
+        key=Stats.key(handler)
+        if base not in self.handlers:
+            self.handlers[base]=[]
+            self.subscribe(base)
+        handlers=self.handlers[base]
+        for idx, (handler_detail, _, handler_key) in enumerate(handlers):
+            if handler_detail == detail and handler_key == key:
+                handlers[idx]=(detail, handler, key)
+                break
+        else:
+            handlers.append((detail, handler, key))
+        return base, detail, key
+
+    def off(self, handle: Tuple) -> None:
+        """ Remove subscription by the handle returned from on(). """
+        base, detail, key=handle
+        self.handlers[base]=[
+            entry for entry in self.handlers.get(base, [])
+            if (entry[0], entry[2]) != (detail, key)
+        ]
+
+    def counts(self) -> Dict[str, int]:
+        """ Number of registered handlers per module, should stay constant
+        across config reloads. """
+        ret: Dict[str, int]={}
+        for handlers in self.handlers.values():
+            for _, _, (mod, _) in handlers:
+                ret[mod]=ret.get(mod, 0) + 1
+        return ret
+
+    def subscriptions(self, mod: str) -> List[str]:
+        """ Events the module handlers are subscribed to. """
+        return [
+            f'{base}::{detail}' if detail else base
+            for base, handlers in self.handlers.items()
+            for detail, _, key in handlers if key[0] == mod
+        ]
+
+    def subscribe(self, base: str) -> None:
+        if self.aio is not None:
+            self.aio.on(base, functools.partial(self.emit_aio, base))
+        else:
+            self.i3ipc.on(base, functools.partial(self.emit, base))
+
+    async def attach_aio(self) -> None:
+        """ Switch to the asyncio runtime: receive all events from i3ipc.aio
+        connection on the current loop. """
+        self.pending=asyncio.Queue()
+        self.aio_lock=asyncio.Lock()
+        self.aio=await i3ipc.aio.Connection(auto_reconnect=True).connect()
+        for base in self.handlers:
+            self.subscribe(base)
+        self.loop.create_task(self.pump())
+
+    def emit(self, base: str, conn, event) -> None:
+        detail=getattr(event, 'change', '')
+        self.fanout(base, event, [
+            (handler, conn, event, key)
+            for handler_detail, handler, key in list(self.handlers[base])
+            if not handler_detail or handler_detail == detail
+        ])
+
+    def emit_aio(self, base: str, conn, event) -> None:
+        self.pending.put_nowait((base, conn, event))
+
+    async def pump(self) -> None:
+        """ asyncio runtime: handle queued events one by one. """
+        while True:
+            base, conn, event=await self.pending.get()
+            try:
+                await self.fanout_aio(base, event, self.aio_calls(base, conn, event))
+            except Exception:
+                logging.exception(f'{base} event handling failed')
+
+    def aio_calls(self, base: str, conn, event) -> List[Tuple]:
+        detail=getattr(event, 'change', '')
+        sync_event=None
+        calls=[]
+        for handler_detail, handler, key in list(self.handlers[base]):
+            if handler_detail and handler_detail != detail:
+                continue
+            if inspect.iscoroutinefunction(handler):
+                calls.append((handler, conn, event, key))
+                continue
+            if sync_event is None:
+                sync_event=self.sync_event(base, event)
+            calls.append((handler, self.i3ipc, sync_event, key))
+        return calls
+
+    def fanout(self, base: str, event, calls: List[Tuple]) -> None:
+        """ Call (handler, conn, event, key) list, when the session recorder
+        is active the event is logged with per handler durations. Changes
+        are published to subscribe clients afterwards. """
+        recorder=Recorder.current
+        if recorder is None:
+            for handler, conn, handler_event, key in calls:
+                self.call(handler, conn, handler_event, key=key)
+        else:
+            start=timeit.default_timer()
+            durations=[]
+            for handler, conn, handler_event, key in calls:
+                handler_start=timeit.default_timer()
+                self.call(handler, conn, handler_event, key=key)
+                durations.append((key, timeit.default_timer() - handler_start))
+            recorder.event(base, event, start, durations)
+        Publisher.check()
+
+    async def fanout_aio(self, base: str, event, calls: List[Tuple]) -> None:
+        """ fanout for the asyncio runtime, coroutine handlers are awaited
+        before the next handler is called. """
+        recorder=Recorder.current
+        if recorder is None:
+            for handler, conn, handler_event, key in calls:
+                await self.call_aio(handler, conn, handler_event, key=key)
+        else:
+            start=timeit.default_timer()
+            durations=[]
+            for handler, conn, handler_event, key in calls:
+                handler_start=timeit.default_timer()
+                await self.call_aio(handler, conn, handler_event, key=key)
+                durations.append((key, timeit.default_timer() - handler_start))
+            recorder.event(base, event, start, durations)
+        Publisher.check()
+
+    def sync_event(self, base: str, event):
+        event_cls=Dispatcher.sync_events.get(base)
+        if event_cls is None:
+            return event
+        return event_cls(event.ipc_data, self.i3ipc)
+
+    def call(self, handler: Callable, *args, key=None, spawn=True):
+        """ Call handler, schedule it on the loop if it returns awaitable.
+        Exceptions are logged, so one broken handler cannot stop i3 events
+        processing for everything else. Latency is accounted in Stats.
+            spawn: return the awaitable to the caller instead. """
+        try:
+            ret=Stats.call(key or Stats.key(handler), handler, *args)
+        except Exception:
+            logging.exception(f'handler {handler} failed')
+            return None
+        if inspect.isawaitable(ret) and spawn:
+            self.spawn(ret)
+            return None
+        return ret
+
+    async def call_aio(self, handler: Callable, *args, key=None):
+        """ Call handler and wait for it when it returns awaitable, then send
+        the commands it batched. """
+        ret=self.call(handler, *args, key=key, spawn=False)
+        if inspect.isawaitable(ret):
+            try:
+                ret=await ret
+            except Exception:
+                logging.exception(f'handler {handler} failed')
+                ret=None
+        await self.drain()
+        return ret
+
+    def spawn(self, coro) -> None:
+        """ Run coroutine where module code runs: as a loop task in the
+        asyncio runtime, to completion right here on the event thread in
+        the threaded one. """
+        if self.aio is not None:
+            self.loop.create_task(self.drained(coro))
+        else:
+            Dispatcher.complete(coro)
+
+    async def drained(self, coro):
+        try:
+            return await coro
+        finally:
+            await self.drain()
+
+    @staticmethod
+    def complete(awaitable):
+        """ Threaded runtime: run awaitable to completion on the calling
+        thread, with its own short-lived loop. """
+        async def run():
+            return await awaitable
+        try:
+            return asyncio.run(run())
+        except Exception:
+            logging.exception(f'{awaitable} failed')
+            return None
+
+    async def drain(self) -> None:
+        """ asyncio runtime: send commands batched on the loop and wait for
+        the reply. """
+        if not CommandBatch.pending or self.aio is None:
+            return
+        async with self.aio_lock:
+            cmds=CommandBatch.take()
+            if not cmds:
+                return
+            try:
+                CommandBatch.check(cmds, await self.aio_command('; '.join(cmds)))
+            except Exception:
+                logging.exception(f'i3 command failed: {cmds}')
+
+    async def command(self, cmd: str) -> List:
+        """ Send i3 command without blocking other events: natively in the
+        asyncio runtime, via executor thread otherwise. Batched commands
+        are sent before it. """
+        if self.aio is not None:
+            await self.drain()
+            async with self.aio_lock:
+                return await self.aio_command(cmd)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.i3ipc.command, cmd)
+
+    async def aio_command(self, cmd: str) -> List:
+        """ RUN_COMMAND on the aio connection, aio_lock should be held. """
+        Stats.count_round_trip()
+        start=timeit.default_timer()
+        try:
+            return await self.aio.command(cmd)
+        finally:
+            if Recorder.current is not None:
+                Recorder.current.command(cmd, start)
+
+    async def get_tree(self):
+        """ GET_TREE on the aio connection, asyncio runtime only. Requests
+        share the command socket, so they are sent in call order with the
+        commands, batched ones first. """
+        await self.drain()
+        Stats.count_round_trip()
+        async with self.aio_lock:
+            return await self.aio.get_tree()
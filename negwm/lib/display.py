@@ -6,16 +6,29 @@ from negwm.lib.misc import Misc
 
 
 class Display():
-    d = display.Display()
-    s = d.screen()
-    window = s.root.create_window(0, 0, 1, 1, 1, s.root_depth)
-    xrandr_cache = randr.get_screen_info(window)._data
+    """ X display is opened on the first query, so the module can be imported
+    without X session. """
+    d = None
+    s = None
+    window = None
+    xrandr_cache = {}
     resolution_list = []
 
+    @classmethod
+    def xrandr_info(cls) -> dict:
+        if not Display.xrandr_cache:
+            Display.d = display.Display()
+            Display.s = Display.d.screen()
+            Display.window = Display.s.root.create_window(
+                0, 0, 1, 1, 1, Display.s.root_depth)
+            Display.xrandr_cache = randr.get_screen_info(Display.window)._data
+        return Display.xrandr_cache
+
     @classmethod
     def get_screen_resolution(cls) -> dict:
-        size_id = Display.xrandr_cache['size_id']
-        resolution = Display.xrandr_cache['sizes'][size_id]
+        xrandr_cache = Display.xrandr_info()
+        size_id = xrandr_cache['size_id']
+        resolution = xrandr_cache['sizes'][size_id]
         return {
             'width': int(resolution['width_in_pixels']),
             'height': int(resolution['height_in_pixels'])
@@ -23,7 +36,7 @@ class Display():
 
     @classmethod
     def get_screen_resolution_data(cls) -> dict:
-        return Display.xrandr_cache['sizes']
+        return Display.xrandr_info()['sizes']
 
     @classmethod
     def xrandr_resolution_list(cls) -> dict:
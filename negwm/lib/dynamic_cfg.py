@@ -1,6 +1,7 @@
 """ Stuff for dynamic config change on the fly """
 from negwm.lib.cfg import cfg
 from negwm.lib.props import props
+from negwm.lib.extension import extension
 
 class dynamic_cfg(cfg):
     def __init__(self, i3) -> None:
@@ -37,16 +38,20 @@ class dynamic_cfg(cfg):
             'tag': tag,
             'prop': prop_str})
         self.additional_props=list(filter(len, self.additional_props))
+        self.config_changed()
+        self.dump_config()
 
     def del_props(self, tag: str, prop_str: str) -> None:
         """ Remove window from some tag.
         tag (str): target tag
         prop_str (str): property string in special format. """
         config=self.cfg
-        tree=self.i3ipc.get_tree()
+        tree=extension.tree(self)
         props.str_to_winattr(self.win_attrs, prop_str)
         props.del_direct_props(config, self.win_attrs, tag)
         props.del_regex_props(config, tree, self.win_attrs, tag)
         for prop in props.cfg_regex_props() | props.cfg_props():
             if prop in self.conf(tag) and self.conf(tag, prop) == set():
                 del config[tag][prop]
+        self.config_changed()
+        self.dump_config()
@@ -0,0 +1,70 @@
+""" Runs module code on the i3 event thread. In the threaded runtime i3 events are handled by the blocking i3ipc main() loop, while socket
+commands and config reloads arrive on the asyncio thread. Both mutate the same tag lists and containers, so everything from the other
+threads is queued here in arrival order, then i3 is asked to send a tick event and the queue is drained by the tick handler on the event
+thread. i3 sends the first tick right after subscription, so requests queued before main() started are drained as soon as it is up. """
+
+import collections
+import logging
+import threading
+import timeit
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, Tuple
+
+from negwm.lib.publisher import Publisher
+from negwm.lib.stats import Histogram
+
+
+class Executor():
+    payload='negwm-executor' # tick payload, any tick drains the queue anyway
+    resend=1.0 # seconds, wakeup tick is sent again if it was lost
+
+    def __init__(self, i3) -> None:
+        self.i3ipc=i3
+        self.lock=threading.Lock()
+        self.queue: Deque[Tuple]=collections.deque()
+        self.wakeup=0.0 # time of the pending wakeup tick, 0 if none
+        self.wait=Histogram() # time from submit to start
+
+    def subscribe(self, on: Callable) -> None:
+        on('tick', self.on_tick)
+
+    def submit(self, func: Callable, *args) -> Future:
+        """ Run func(*args) on the event thread, returns its future. """
+        future: Future=Future()
+        now=timeit.default_timer()
+        with self.lock:
+            self.queue.append((func, args, future, now))
+            wakeup=not self.wakeup or now - self.wakeup > Executor.resend
+            if wakeup:
+                self.wakeup=now
+        if wakeup:
+            try:
+                self.i3ipc.send_tick(Executor.payload)
+            except Exception:
+                logging.exception('Cannot wake up i3 event thread')
+        return future
+
+    def on_tick(self, *_) -> None:
+        self.drain()
+
+    def drain(self) -> None:
+        with self.lock:
+            items=list(self.queue)
+            self.queue.clear()
+            self.wakeup=0.0
+        if not items:
+            return
+        for func, args, future, queued in items:
+            if not future.set_running_or_notify_cancel():
+                continue # timed out while queued
+            self.wait.add(timeit.default_timer() - queued, 0)
+            try:
+                future.set_result(func(*args))
+            except BaseException as err:
+                future.set_exception(err)
+        Publisher.check()
+
+    def stats(self) -> Dict:
+        wait=self.wait.report()
+        del wait['round_trips']
+        return {'queued': len(self.queue), 'wait': wait}
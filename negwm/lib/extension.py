@@ -1,16 +1,103 @@
 """ All extensions can send messages :) """
-from typing import List
+import logging
+from typing import Callable, List, Optional
 from typing import Dict
 from negwm.lib.msgbroker import MsgBroker
+from negwm.lib.batch import CommandBatch
 
 class extension():
+    tree_cache=None # shared TreeCache, set by NegWM
+    dispatcher=None # shared i3 events Dispatcher, set by NegWM
+    router=None # compiled commands Router, set by NegWM
+    executor=None # i3 event thread Executor, threaded runtime, set by NegWM
+
     def __init__(self):
         pass
 
+    def on(self, event: str, handler: Callable) -> None:
+        """ Subscribe module handler to i3 event. Handler can be a coroutine
+        function, then it is scheduled on the negwm asyncio loop. Repeated
+        subscription of the same method replaces the previous one, so
+        modules can subscribe from their (re)initialization code. """
+        if extension.dispatcher is not None:
+            extension.dispatcher.on(event, handler)
+            return
+        handles=self.__dict__.setdefault('i3_handles', {})
+        key=(event, getattr(handler, '__name__', str(handler)))
+        if key in handles:
+            self.i3ipc.off(handles[key])
+        handles[key]=handler
+        self.i3ipc.on(event, handler)
+
+    def published_state(self) -> Optional[Dict]:
+        """ State streamed to `subscribe` socket clients, see Publisher.
+        None for modules without one. """
+        return None
+
+    async def command_async(self, cmd: str) -> List:
+        """ i3 command for coroutine handlers, does not block other events. """
+        if extension.dispatcher is None:
+            return self.i3ipc.command(cmd)
+        return await extension.dispatcher.command(cmd)
+
+    def batch(self) -> CommandBatch:
+        """ Command batch for the current action, see CommandBatch. """
+        return CommandBatch.current(self.i3ipc)
+
+    def tree(self, sync: bool=False):
+        """ Return i3 tree from the shared cache. Falls back to plain GET_TREE
+        when module is used without negwm runner.
+        sync (bool): bypass the cache, needed to read fresh floating rects. """
+        if extension.tree_cache is None:
+            return self.i3ipc.get_tree()
+        return extension.tree_cache.get(sync)
+
+    def focused(self, sync: bool=False):
+        """ Return focused container from the shared cache. """
+        if extension.tree_cache is None:
+            return self.i3ipc.get_tree().find_focused()
+        return extension.tree_cache.find_focused(sync)
+
     @staticmethod
     def get_mods() -> Dict:
         return MsgBroker.get_mods()
 
+    @staticmethod
+    def get_mod(name: str):
+        """ Return module by name, deferred module is loaded here. """
+        mods=extension.get_mods()
+        if mods.get(name) is None and extension.router is not None:
+            extension.router.load(name)
+        return mods.get(name)
+
+    @staticmethod
+    def update_i3_config() -> None:
+        """ Regenerate i3 config in-process. Call it where i3 events are
+        handled: the config is generated from module configs right here,
+        only validation and file writes run in background, see
+        configurator.write. Unchanged results are skipped. """
+        try:
+            configurator=extension.get_mod('configurator')
+            if configurator is not None:
+                configurator.write()
+        except Exception:
+            logging.exception('i3 config generation failed')
+
+    @staticmethod
+    def call_later(delay: float, func: Callable, *args) -> None:
+        """ Run func(*args) after delay where i3 events are handled: on the
+        event thread via Executor in the threaded runtime, on the loop in
+        the asyncio one. Called at once without negwm runner. """
+        if extension.dispatcher is None:
+            func(*args)
+            return
+        loop=extension.dispatcher.loop
+        if extension.executor is None:
+            loop.call_soon_threadsafe(loop.call_later, delay, func, *args)
+        else:
+            loop.call_soon_threadsafe(
+                loop.call_later, delay, extension.executor.submit, func, *args)
+
     @staticmethod
     def get_mods_list() -> List:
         return list(MsgBroker.get_mods_list())
@@ -19,6 +106,7 @@ class extension():
         """ Creates bindings from socket IPC to current module public function
         calls. This function defines bindings to the module methods that can be
         used by external users as i3-bindings, etc. Need the [send] binary
-        which can send commands to the appropriate socket.
+        which can send commands to the appropriate socket. Only commands
+        declared with @command are reachable.
         args (List): argument list for the selected function. """
-        return getattr(self, args[0])(*args[1:])
+        return extension.router.dispatch(self.__class__.__name__, args)
@@ -1,7 +1,9 @@
 """ Module to convert some screen geometry to target screen geometry. This module contains geometry converter and also i3-rules generator.
 """
 
+import logging
 import re
+import Xlib.error
 from negwm.lib.display import Display
 
 class Geom():
@@ -13,7 +15,12 @@ class Geom():
         self.move_cmds = {} # Command to move windows to the desired geometry.
         self.parsed_geom = {} # Geometry after parse
         self.converted_geom = {} # Geometry in the list format for future reuse after conversion
-        self.current_resolution = Display.get_screen_resolution()
+        try:
+            self.current_resolution = Display.get_screen_resolution()
+        except Xlib.error.DisplayError as err: # negwm compile without X
+            logging.warning(f'No X display ({err}), geometry is kept for '
+                f'{Geom.resolution_default["width"]}x{Geom.resolution_default["height"]}')
+            self.current_resolution = Geom.resolution_default
         if cfg:
             self.cfg = cfg # External config
             for tag in self.cfg:
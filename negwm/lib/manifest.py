@@ -0,0 +1,89 @@
+""" Module manifest: i3 events every module subscribes to and commands it exports. Modules without events are purely command-driven, NegWM
+does not import them at startup, the router loads them on the first command instead. Modules needed at startup anyway (configurator) are
+marked eager. Modules missing here are loaded eagerly. Modules whose i3 rules are generated by configurator are marked with rules, `negwm
+compile` imports only them. """
+
+import logging
+from typing import Dict, List
+
+
+class Manifest():
+    cfg_commands=['get_config', 'get_added_props', 'reload']
+    modules: Dict[str, Dict[str, List[str]]]={
+        'actions': {
+            'events': [],
+            'commands': cfg_commands + [
+                'grow', 'shrink', 'x2', 'maximize', 'revert_maximize',
+                'resize', 'focus_tab', 'next_ws', 'move_tab',
+            ],
+        },
+        'circle': {
+            'events': [
+                'window::new', 'window::close', 'window::focus',
+                'window::fullscreen_mode', 'window::title',
+            ],
+            'commands': cfg_commands + ['next', 'subtag', 'add_prop', 'del_prop'],
+            'rules': True,
+        },
+        'configurator': {
+            'events': [],
+            'commands': cfg_commands + ['print', 'write', 'raw_ws'],
+            'eager': True, # i3 config is generated on every startup
+        },
+        'fullscreen': {
+            'events': ['window::close', 'workspace::focus'],
+            'commands': cfg_commands + ['fullscreen'],
+        },
+        'lastgo': {
+            'events': ['window::focus', 'window::close'],
+            'commands': cfg_commands + [
+                'switch', 'focus_next', 'focus_prev', 'focus_next_visible',
+                'focus_prev_visible',
+            ],
+        },
+        'reflection': {
+            'events': [],
+            'commands': [],
+        },
+        'scratchpad': {
+            'events': ['window::new', 'window::close', 'window::title'],
+            'commands': cfg_commands + [
+                'taglist', 'show', 'dialog', 'toggle', 'subtag', 'next',
+                'hide_current', 'geom_restore', 'geom_autosave', 'geom_dump',
+                'geom_save', 'add_prop', 'del_prop',
+            ],
+            'rules': True,
+        },
+    }
+
+    @staticmethod
+    def lazy(name: str) -> bool:
+        """ Module can be imported on the first command: it has no events and
+        is not needed at startup. """
+        entry=Manifest.modules.get(name)
+        return entry is not None and not entry['events'] \
+            and not entry.get('eager', False)
+
+    @staticmethod
+    def rules() -> List[str]:
+        """ Modules configured internally: configurator reads their configs. """
+        return [name for name, entry in Manifest.modules.items()
+                if entry.get('rules', False)]
+
+    @staticmethod
+    def commands(name: str) -> List[str]:
+        return Manifest.modules.get(name, {}).get('commands', [])
+
+    @staticmethod
+    def check(name: str, commands, events) -> None:
+        """ Warn when loaded module does not match its manifest entry. """
+        entry=Manifest.modules.get(name)
+        if entry is None:
+            return
+        for what, declared, actual in (
+                ('commands', entry['commands'], commands),
+                ('events', entry['events'], events)):
+            diff=set(declared) ^ set(actual)
+            if diff:
+                logging.warning(
+                    f'{name}: {what} differ from manifest: {sorted(diff)}')
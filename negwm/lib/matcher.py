@@ -3,7 +3,106 @@ circle run-or-raise, etc. """
 
 import sys
 import re
-from typing import List, Iterator
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from negwm.lib.cfg import cfg
+from negwm.lib.rule_index import RuleIndex
+
+
+class Rules():
+    """ Match rules of one tag compiled from its config: exact factors are
+    frozensets, regex factors are one alternation per factor, so matching
+    costs one hash lookup or one search per factor.
+    Alternations are not anchored: patterns keep re.search semantics, as
+    they always had, so `class_r: [term]` still matches `Alacritty-term`;
+    add ^...$ in the config to anchor a pattern. A plain string value of
+    an exact factor (`classw: Term` instead of a list) is kept as it was: a
+    substring test of the window value in that string,
+    `win.window_class in 'Term'`. """
+    exact=(
+        (sys.intern("classw"), "window_class"),
+        (sys.intern("instance"), "window_instance"),
+        (sys.intern("role"), "window_role"),
+    )
+    regex=(
+        (sys.intern("class_r"), "window_class"),
+        (sys.intern("instance_r"), "window_instance"),
+        (sys.intern("name_r"), "name"),
+        (sys.intern("role_r"), "window_role"),
+    )
+    global_flags=re.compile(r'\(\?[aiLmsux]+\)') # (?i) etc, pattern-wide
+
+    def __init__(self, tag: str, conf: Dict) -> None:
+        self.sets: List[Tuple[str, frozenset]]=[]
+        self.patterns: List[Tuple[str, Tuple]]=[]
+        self.within: List[Tuple[str, str]]=[]
+        for factor, attr in Rules.exact:
+            value=conf.get(factor)
+            if isinstance(value, str): # window value is a substring of it
+                self.within.append((attr, value))
+                continue
+            values=Rules.values(value)
+            if values:
+                self.sets.append((attr, frozenset(values)))
+        for factor, attr in Rules.regex:
+            patterns=Rules.compile(tag, factor, Rules.values(conf.get(factor)))
+            if patterns:
+                self.patterns.append((attr, patterns))
+        self.by_name=any(attr == 'name' for attr, _ in self.patterns)
+
+    @staticmethod
+    def values(value) -> List:
+        """ Config factor value as list: single pattern string means one
+        pattern. """
+        if not value:
+            return []
+        if isinstance(value, (str, bytes)) or not isinstance(value, Iterable):
+            return [value]
+        return list(value)
+
+    @staticmethod
+    def compile(tag: str, factor: str, patterns: List) -> Tuple:
+        """ Compile regex factor to one alternation. Patterns with groups or
+        inline global flags do not combine and are kept separate. Invalid
+        patterns are logged and skipped. """
+        union, separate=[], []
+        for pattern in map(str, patterns):
+            try:
+                compiled=re.compile(pattern)
+            except re.error as err:
+                logging.error(f'{tag}: bad {factor} pattern {pattern!r}: {err}')
+                continue
+            if compiled.groups or Rules.global_flags.match(pattern):
+                separate.append(compiled)
+            else:
+                union.append(pattern)
+        if len(union) == 1:
+            separate.insert(0, re.compile(union[0]))
+        elif union:
+            separate.insert(0, re.compile('|'.join(f'(?:{p})' for p in union)))
+        return tuple(separate)
+
+    def match(self, win) -> bool:
+        for attr, values in self.sets:
+            if getattr(win, attr) in values:
+                return True
+        return self.search(win)
+
+    def search(self, win) -> bool:
+        """ Check the factors which are not exact matches: regexes and plain
+        string values. """
+        for attr, text in self.within:
+            value=getattr(win, attr)
+            if isinstance(value, str) and value in text:
+                return True
+        for attr, patterns in self.patterns:
+            value=getattr(win, attr)
+            if value:
+                for pattern in patterns:
+                    if pattern.search(value):
+                        return True
+        return False
+
 
 class Matcher():
     """ Generic matcher class
@@ -13,8 +112,8 @@ class Matcher():
         - by instance, by instance regex
         - by role, by role regex
         - by name regex
-    Of course this list can by expanded. It uses sys.intern hack for better
-    performance and simple caching. One of the most resource intensive part of
+    Of course this list can by expanded. Tag rules are compiled once per
+    config generation, see Rules. One of the most resource intensive part of
     negwm. """
     factors = [
         sys.intern("classw"),
@@ -26,89 +125,94 @@ class Matcher():
         sys.intern("role_r"),
     ]
 
+    title_delay = 0.25 # seconds, title changes are coalesced for this time
+
     def __init__(self):
         self.win = None
-        self.matched_list = []
-        self.match_dict = {
-            sys.intern("classw"): lambda: self.win.window_class in self.matched_list,
-            sys.intern("instance"): lambda: self.win.window_instance in self.matched_list,
-            sys.intern("role"): lambda: self.win.window_role in self.matched_list,
-            sys.intern("class_r"): self.class_r,
-            sys.intern("instance_r"): self.instance_r,
-            sys.intern("role_r"): self.role_r,
-            sys.intern("name_r"): self.name_r,
-        }
+        self.compiled: Dict[str, Optional[Rules]] = {}
+        self.compiled_name_tags: Optional[List[str]] = None
+        self.compiled_generation = -1
+        self.retitled: Dict[int, Any] = {} # window id -> pending title event
+        RuleIndex.register(self)
 
-    @staticmethod
-    def find_classed(win: List, pattern: str) -> Iterator:
-        """ Returns iterator to find by window class """
-        return (c for c in win
-                if c.window_class and re.search(pattern, c.window_class))
+    def check_generation(self) -> None:
+        """ Drop compiled rules after any config change. """
+        if self.compiled_generation != cfg.generation:
+            self.compiled = {}
+            self.compiled_name_tags = None
+            self.compiled_generation = cfg.generation
 
-    @staticmethod
-    def find_instanced(win: List, pattern: str) -> Iterator:
-        """ Returns iterator to find by window instance """
-        return (c for c in win
-                if c.window_instance and re.search(pattern, c.window_instance))
+    def tag_rules(self, tag_name: str) -> Optional[Rules]:
+        """ Compiled rules of the tag, None for non-tag config entries.
+        Compiled lazily, dropped when any config changes. """
+        self.check_generation()
+        try:
+            return self.compiled[tag_name]
+        except KeyError:
+            tag = self.cfg.get(tag_name)
+            rules = Rules(tag_name, tag) if isinstance(tag, dict) else None
+            self.compiled[tag_name] = rules
+            return rules
 
-    @staticmethod
-    def find_by_role(win: List, pattern: str) -> Iterator:
-        """ Returns iterator to find by window role """
-        return (c for c in win
-                if c.window_role and re.search(pattern, c.window_role))
+    def match(self, win, tag_name: str) -> bool:
+        """ Check that window matches to the config rules """
+        self.win = win
+        rules = self.tag_rules(tag_name)
+        return rules is not None and rules.match(win)
 
-    @staticmethod
-    def find_named(win: List, pattern: str) -> Iterator:
-        """ Returns iterator to find by window name """
-        return (c for c in win if c.name and re.search(pattern, c.name))
-
-    def class_r(self) -> bool:
-        """ Check window by class with regex """
-        for pattern in self.matched_list:
-            cls_by_regex = Matcher.find_classed([self.win], pattern)
-            if cls_by_regex:
-                for class_regex in cls_by_regex:
-                    if self.win.window_class == class_regex.window_class:
-                        return True
-        return False
+    def matched_tags(self, win) -> Sequence[str]:
+        """ Tags of this module matching the window, in config order. Window
+        is classified for all modules at once, see RuleIndex. """
+        name = self.__class__.__name__
+        if RuleIndex.mods.get(name) is not self: # not the live instance
+            return [tag for tag in self.cfg if self.match(win, tag)]
+        return RuleIndex.classify(win).get(name, ())
 
-    def instance_r(self) -> bool:
-        """ Check window by instance with regex """
-        for pattern in self.matched_list:
-            inst_by_regex = Matcher.find_instanced([self.win], pattern)
-            if inst_by_regex:
-                for inst_regex in inst_by_regex:
-                    if self.win.window_instance == inst_regex.window_instance:
-                        return True
-        return False
+    def matched_windows(self, wins) -> List[Tuple[Any, Sequence[str]]]:
+        """ Windows with the tags of this module they match, in window
+        order. Batch version of matched_tags for startup and rescans. """
+        name = self.__class__.__name__
+        if RuleIndex.mods.get(name) is not self:
+            return [(win, self.matched_tags(win)) for win in wins]
+        matched = RuleIndex.classify_all(wins)
+        return [(win, matched[win.id].get(name, ())) for win in wins]
 
-    def role_r(self) -> bool:
-        """ Check window by role with regex """
-        for pattern in self.matched_list:
-            role_by_regex = Matcher.find_by_role([self.win], pattern)
-            if role_by_regex:
-                for role_regex in role_by_regex:
-                    if self.win.window_role == role_regex.window_role:
-                        return True
-        return False
+    def name_tags(self) -> List[str]:
+        """ Tags with name_r rules: the only ones window title can change.
+        Computed once per config generation, with the compiled rules. """
+        self.check_generation()
+        if self.compiled_name_tags is None:
+            self.compiled_name_tags = [
+                tag for tag in self.cfg
+                if (rules := self.tag_rules(tag)) is not None and rules.by_name
+            ]
+        return self.compiled_name_tags
 
-    def name_r(self) -> bool:
-        """ Check window by name with regex """
-        for pattern in self.matched_list:
-            name_by_regex = Matcher.find_named([self.win], pattern)
-            if name_by_regex:
-                for name_regex in name_by_regex:
-                    if self.win.name == name_regex.name:
-                        return True
-        return False
+    def title_changed(self, _, event) -> None:
+        """ window::title handler. Title changes are coalesced per window and
+        handled together after title_delay, a burst of titles costs one
+        retag with the final title. Nothing to do without name_r rules.
+        Modules using it implement retitle(win, tags, matched): update tag
+        membership of the window, tags are the ones with name_r rules,
+        matched is the subset of them matching the window now. """
+        win = event.container
+        if not self.name_tags() or win.id in self.retitled:
+            return
+        self.retitled[win.id] = win
+        if len(self.retitled) == 1:
+            self.call_later(Matcher.title_delay, self.retag_titled)
 
-    def match(self, win, tag_name: str) -> bool:
-        """ Check that window matches to the config rules """
-        self.win = win
-        for f in Matcher.factors:
-            tag = self.cfg.get(tag_name)
-            if isinstance(tag, dict):
-                self.matched_list = tag.get(f, {})
-            if self.matched_list and self.match_dict[f]():
-                return True
-        return False
+    def retag_titled(self) -> None:
+        """ Re-evaluate name_r tags of the retitled windows with their current
+        title, closed windows are skipped. """
+        pending, self.retitled = self.retitled, {}
+        tags = self.name_tags()
+        if not tags:
+            return
+        tree = self.tree()
+        for win_id in pending:
+            win = tree.find_by_id(win_id)
+            if win is None:
+                continue
+            matched = {tag for tag in tags if self.tag_rules(tag).match(win)}
+            self.retitle(win, tags, matched)
@@ -5,9 +5,12 @@ import errno
 import re
 import logging
 from typing import List
+from negwm.lib.startup_cache import StartupCache
 
 class Misc():
     ''' Implements various helper functions '''
+    i3_cfg='' # current i3 config path, see current_i3_cfg
+
     @staticmethod
     def create_dir(dirname) -> None:
         ''' Helper function to create directory
@@ -73,9 +76,16 @@ class Misc():
 
     @staticmethod
     def current_i3_cfg() -> str:
+        ''' i3 config path. i3-config-wizard is run only when the path is not
+        known yet or the file is gone, the result is kept in StartupCache. '''
         def find_between(s, start, end):
             return (s.split(start))[1].split(end)[0]
-        return find_between(str(Misc.i3_cfg_try_create()), 'file "', '" already')
+        path=Misc.i3_cfg or StartupCache.get('i3_cfg', '')
+        if not path or not os.path.isfile(path):
+            path=find_between(str(Misc.i3_cfg_try_create()), 'file "', '" already')
+            StartupCache.set('i3_cfg', path)
+        Misc.i3_cfg=path
+        return path
 
     @staticmethod
     def print_run_exception_info(proc_err) -> None:
@@ -1,14 +1,110 @@
 """ MsgBroker handles all requests to mods in format like this:
     <mod> <cmd> <arguments>
     To use it you can run smth like this for example:
-    echo 'circle next web' | nc localhost 15555 -N """
+    echo 'circle next web' | nc -U $XDG_RUNTIME_DIR/negwm/negwm.sock -N
+    `stats` message returns per-handler latency report. Replies are JSON, framed connections negotiate it, see Codec.
+    `subscribe <topic>...` streams change notifications until the client disconnects, see Publisher.
+
+Requests to one module are serialized through its Actor queue and no client connection blocks the others. Module code itself runs on one
+thread: inline on the shared loop in the asyncio runtime, on the i3 event thread via Executor in the threaded one, so a slow command of
+one module delays commands of the others. Slow I/O is kept off that thread: configurator validates and writes the i3 config on its own
+worker, configs are dumped by CfgPersister. `stats` reports the Actor queue wait per module under `msgbroker`, the wait for the event
+thread under `executor`. """
 
 import asyncio
-import pickle
-from typing import Dict, List
+import inspect
+import logging
+import timeit
+from typing import Dict, List, Optional
+from negwm.lib.codec import Codec
+from negwm.lib.dispatcher import Dispatcher
+from negwm.lib.publisher import Publisher, Subscription
+from negwm.lib.recorder import Recorder
+from negwm.lib.stats import Histogram, Stats
+from negwm.lib.transport import Frame, Transport
+
+
+class Actor():
+    """ Request queue of one module. In the threaded runtime commands are
+    executed on the i3 event thread via Executor, in the asyncio runtime
+    they run inline on the loop shared with i3 events. Either way module
+    code never runs on two threads at once. """
+    def __init__(self, name: str, executor=None) -> None:
+        self.name=name
+        self.queue: asyncio.Queue=asyncio.Queue()
+        self.executor=executor
+        self.max_depth=0
+        self.timeouts=0
+        self.wait=Histogram() # time spent in the queue
+        self.task=asyncio.get_running_loop().create_task(self.run())
+
+    async def submit(self, args: List[str], timeout: float):
+        """ Queue request and wait for its result. Request which is not
+        started before the timeout is dropped. """
+        future=asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((args, future, timeit.default_timer()))
+        self.max_depth=max(self.max_depth, self.queue.qsize())
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts+=1
+            logging.warning(f'{" ".join(args)}: timed out after {timeout}s')
+            return None
+
+    async def run(self) -> None:
+        while True:
+            args, future, queued=await self.queue.get()
+            if future.done(): # timed out while queued
+                continue
+            self.wait.add(timeit.default_timer() - queued, 0)
+            try:
+                ret=await self.call(args)
+            except Exception:
+                logging.exception(f'{" ".join(args)}: failed')
+                ret=None
+            if not future.done():
+                future.set_result(ret)
+
+    async def call(self, args: List[str]):
+        router=MsgBroker.router
+        if self.executor is None:
+            ret=router.dispatch(self.name, args[1:])
+            if inspect.isawaitable(ret):
+                ret=await ret
+            if MsgBroker.dispatcher is not None:
+                await MsgBroker.dispatcher.drain()
+            Publisher.check()
+            return ret
+        # Executor publishes changes itself
+        return await asyncio.wrap_future(
+            self.executor.submit(Actor.dispatch, self.name, args[1:]))
+
+    @staticmethod
+    def dispatch(name: str, args: List[str]):
+        """ Threaded runtime, on the event thread: coroutine commands are
+        completed here too, not on the loop thread. """
+        ret=MsgBroker.router.dispatch(name, args)
+        if inspect.isawaitable(ret):
+            ret=Dispatcher.complete(ret)
+        return ret
+
+    def stats(self) -> Dict:
+        wait=self.wait.report()
+        return {
+            'depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'timeouts': self.timeouts,
+            'requests': wait['calls'],
+            'wait_p50': wait['p50'],
+            'wait_p99': wait['p99'],
+        }
+
 
 class MsgBroker():
-    lock=asyncio.Lock()
+    timeout=10.0 # seconds, per request
+    actors: Dict[str, Actor]={}
+    executor=None # runs commands on the i3 event thread, threaded runtime
+    dispatcher=None # sends batched commands after each one, asyncio runtime
 
     @classmethod
     def get_mods(cls) -> Dict:
@@ -19,25 +115,183 @@ class MsgBroker():
         return cls.mods.keys()
 
     @classmethod
-    def mainloop(cls, loop, mods, port) -> None:
+    def mainloop(cls, loop, mods, router, port, executor=None) -> None:
         """ Mainloop by loop create task """
-        cls.mods=mods
-        loop.create_task(asyncio.start_server(
-            cls.handle_client, 'localhost', port))
+        loop.create_task(cls.start(mods, router, port, executor))
         loop.run_forever()
 
+    @classmethod
+    async def start(cls, mods, router, port, executor=None, dispatcher=None):
+        """ Start server on the running loop, used directly by the asyncio
+        runtime where it shares the loop with i3 events.
+            port: also listen on localhost TCP port, if not None.
+            executor: Executor of the i3 event thread, module commands run
+            on the loop itself without it.
+            dispatcher: Dispatcher of the asyncio runtime. """
+        cls.mods, cls.router=mods, router
+        cls.executor, cls.dispatcher=executor, dispatcher
+        Publisher.mods=mods
+        Stats.providers['msgbroker']=cls.stats
+        try:
+            return await Transport.start_servers(cls.handle_client, port)
+        except PermissionError as err:
+            logging.error(f'Command socket is not started: {err}')
+            raise
+
+    @classmethod
+    def actor(cls, name: str) -> Optional[Actor]:
+        actor=cls.actors.get(name)
+        if actor is None and name in cls.mods:
+            actor=cls.actors[name]=Actor(name, cls.executor)
+        return actor
+
+    @classmethod
+    def stats(cls) -> Dict:
+        """ Actor queue depth and wait time per module. Time waiting for the
+        event thread is not included, see Executor.stats. """
+        return {name: actor.stats() for name, actor in cls.actors.items()}
+
+    @classmethod
+    async def request(cls, args: List[str]):
+        name=args[0]
+        if name == 'stats':
+            return Stats.report()
+        actor=cls.actor(name)
+        if actor is None:
+            return cls.router.dispatch(name, args[1:])
+        return await actor.submit(args, cls.timeout)
+
     @classmethod
     async def handle_client(cls, reader, writer) -> None:
         """ Proceed client message here """
-        async with cls.lock:
+        if not Transport.peer_allowed(writer):
+            writer.close()
+            return
+        line=await reader.readline()
+        offer=Frame.parse_hello(line)
+        if offer is not None:
+            encoding=Codec.negotiate(offer)
+            writer.write(Frame.hello_line([encoding]))
+            await cls.handle_frames(reader, writer, encoding)
+            return
+        while True:
+            response=line.decode('utf8').split()
+            if not response:
+                return
+            if response[0] == 'subscribe':
+                await cls.stream(reader, writer, response[1:])
+                return
+            ret=await cls.timed_request(response)
+            if ret:
+                try:
+                    writer.write(Codec.encode(ret) + b'\n')
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+                except Exception:
+                    logging.exception(f'{" ".join(response)}: cannot encode reply')
+                writer.close()
+                await writer.wait_closed()
+            line=await reader.readline()
+
+    @classmethod
+    async def timed_request(cls, args: List[str]):
+        start=timeit.default_timer()
+        ret=await cls.request(args)
+        if Recorder.current is not None:
+            Recorder.current.request(args, start)
+        return ret
+
+    @classmethod
+    async def handle_frames(cls, reader, writer, encoding: str) -> None:
+        """ Framed connection: requests are handled concurrently, every one
+        is answered with its id as soon as it is done.
+            encoding: reply encoding negotiated in the hello. """
+        tasks, streams=set(), set()
+        try:
+            while True:
+                req_id, payload=await Frame.read(reader, Frame.max_request)
+                args=payload.decode('utf8').split()
+                if args and args[0] == 'subscribe':
+                    task=asyncio.ensure_future(cls.stream_frames(
+                        writer, req_id, args[1:], encoding))
+                    streams.add(task)
+                else:
+                    task=asyncio.ensure_future(
+                        cls.reply(writer, req_id, args, encoding))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as err:
+            logging.error(f'Closing client connection: {err}')
+        for task in streams:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+
+    @classmethod
+    async def subscribe(cls, topics: List[str]) -> Subscription:
+        """ New subscription, the initial state snapshot is taken where
+        module code runs, like commands in Actor.call. """
+        sub=Subscription(topics)
+        if cls.executor is None:
+            return Publisher.subscribe(sub)
+        return await asyncio.wrap_future(
+            cls.executor.submit(Publisher.subscribe, sub))
+
+    @classmethod
+    async def stream(cls, reader, writer, topics: List[str]) -> None:
+        """ Line protocol subscription: one JSON notification per line. """
+        sub=await cls.subscribe(topics)
+        eof=asyncio.ensure_future(reader.read())
+        try:
             while True:
-                response=(await reader.readline()).decode('utf8').split()
-                if not response:
+                message=asyncio.ensure_future(sub.queue.get())
+                await asyncio.wait(
+                    {eof, message}, return_when=asyncio.FIRST_COMPLETED)
+                if not message.done():
+                    message.cancel()
                     return
-                name=response[0]
-                ret = cls.mods[name].send_msg(response[1:])
-                if ret:
-                    writer.write(pickle.dumps(ret))
-                    await writer.drain()
-                    writer.close()
-                    await writer.wait_closed()
+                writer.write(Codec.encode(message.result()) + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            eof.cancel()
+            Publisher.unsubscribe(sub)
+            writer.close()
+
+    @classmethod
+    async def stream_frames(cls, writer, req_id: int, topics: List[str],
+                            encoding: str) -> None:
+        """ Framed subscription: every notification is a reply frame with
+        the id of the subscribe request. """
+        sub=await cls.subscribe(topics)
+        try:
+            while not writer.is_closing():
+                writer.write(Frame.pack(
+                    req_id, Codec.encode(await sub.queue.get(), encoding)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            Publisher.unsubscribe(sub)
+
+    @classmethod
+    async def reply(cls, writer, req_id: int, args: List[str],
+                    encoding: str) -> None:
+        ret=await cls.timed_request(args) if args else None
+        try:
+            payload=Codec.encode(ret, encoding) if ret is not None else b''
+        except Exception:
+            logging.exception(f'{" ".join(args)}: cannot encode reply')
+            payload=b''
+        if writer.is_closing():
+            return
+        writer.write(Frame.pack(req_id, payload))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
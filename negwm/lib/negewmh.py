@@ -9,9 +9,17 @@ from ewmh import EWMH
 
 
 class NegEWMH():
-    """ Custom EWMH support functions """
-    disp = Xlib.display.Display()
-    ewmh = EWMH()
+    """ Custom EWMH support functions. X display is opened on the first use,
+    so modules using them can be imported without X session. """
+    disp = None
+    ewmh = None
+
+    @staticmethod
+    def display():
+        if NegEWMH.disp is None:
+            NegEWMH.disp = Xlib.display.Display()
+            NegEWMH.ewmh = EWMH()
+        return NegEWMH.disp
 
     @staticmethod
     @contextmanager
@@ -32,7 +40,7 @@ class NegEWMH():
         fast, then using python EWMH module to detect dialog window type or
         modal state of window.
         win : target window to check """
-        with NegEWMH.window_obj(NegEWMH.disp, win.window) as win_obj:
+        with NegEWMH.window_obj(NegEWMH.display(), win.window) as win_obj:
             try:
                 win_type = NegEWMH.ewmh.getWmWindowType(win_obj, str=True)
             except Xlib.error.BadWindow:
@@ -44,7 +52,7 @@ class NegEWMH():
     @staticmethod
     def is_window_modal(win) -> bool:
         try:
-            with NegEWMH.window_obj(NegEWMH.disp, win.window) as win_obj:
+            with NegEWMH.window_obj(NegEWMH.display(), win.window) as win_obj:
                 win_state = NegEWMH.ewmh.getWmState(win_obj, str=True)
                 return bool('_NET_WM_STATE_MODAL' in win_state)
         except:
@@ -57,7 +65,7 @@ class NegEWMH():
         function. """
         visible_windows = []
         for win in windows_on_ws:
-            with NegEWMH.window_obj(NegEWMH.disp, win.window) as win_obj:
+            with NegEWMH.window_obj(NegEWMH.display(), win.window) as win_obj:
                 win_state = NegEWMH.ewmh.getWmState(win_obj, str=True)
                 if '_NET_WM_STATE_HIDDEN' not in win_state:
                     visible_windows.append(win)
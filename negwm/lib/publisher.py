@@ -0,0 +1,110 @@
+""" Change notifications for `subscribe` socket clients. Topics are module names and `config`. A module topic carries the module
+published_state(): tag -> set of window ids for scratchpad and circle, focus history list for lastgo. The subscriber gets the full state
+first, then only the changes: added and removed ids for sets, the whole new value for everything else. `config` topic tells which module
+config was reloaded.
+
+States are compared after every i3 event fanout and every socket command, only for the topics somebody subscribed to, so there is no cost
+without subscribers and every mutation path is covered. Notifications are delivered to the subscriber queues on their asyncio loop. """
+
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+
+class Subscription():
+    def __init__(self, topics: List[str]) -> None:
+        self.topics=set(topics)
+        self.loop=asyncio.get_running_loop()
+        self.queue: asyncio.Queue=asyncio.Queue()
+
+    def put(self, message: Dict) -> None:
+        """ Thread-safe delivery. """
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+        except RuntimeError: # loop is closed
+            pass
+
+
+class Publisher():
+    lock=threading.RLock()
+    subscriptions: Set[Subscription]=set()
+    states: Dict[str, Any]={} # module -> last published state
+    mods: Dict={} # module name -> module, set by MsgBroker
+
+    @staticmethod
+    def state(name: str) -> Optional[Dict]:
+        mod=Publisher.mods.get(name)
+        if mod is None:
+            return None
+        try:
+            return mod.published_state()
+        except Exception:
+            logging.exception(f'{name}: cannot get published state')
+            return None
+
+    @staticmethod
+    def subscribe(sub: Subscription) -> Subscription:
+        """ Add subscription, the current state of every module topic is
+        queued first. Module states are read here, so call it where module
+        code runs: on the i3 event thread in the threaded runtime. """
+        with Publisher.lock:
+            Publisher.check() # flush pending changes to the others first
+            Publisher.subscriptions.add(sub)
+            for topic in sorted(sub.topics):
+                state=Publisher.state(topic)
+                if state is None:
+                    continue
+                Publisher.states[topic]=state
+                sub.put({'topic': topic, 'state': state})
+        return sub
+
+    @staticmethod
+    def unsubscribe(sub: Subscription) -> None:
+        with Publisher.lock:
+            Publisher.subscriptions.discard(sub)
+
+    @staticmethod
+    def emit(topic: str, message: Dict) -> None:
+        if not Publisher.subscriptions:
+            return
+        with Publisher.lock:
+            for sub in Publisher.subscriptions:
+                if topic in sub.topics:
+                    sub.put({'topic': topic, **message})
+
+    @staticmethod
+    def diff(prev: Dict, state: Dict) -> Dict:
+        ret={}
+        for key in set(prev) | set(state):
+            old, new=prev.get(key), state.get(key)
+            if old == new:
+                continue
+            if isinstance(old, (set, frozenset)) and \
+                    isinstance(new, (set, frozenset)):
+                ret[key]={'added': new - old, 'removed': old - new}
+            else:
+                ret[key]=new
+        return ret
+
+    @staticmethod
+    def check() -> None:
+        """ Publish changes of the subscribed module states. """
+        if not Publisher.subscriptions:
+            return
+        with Publisher.lock:
+            topics=set()
+            for sub in Publisher.subscriptions:
+                topics|=sub.topics
+            for topic in topics:
+                if topic not in Publisher.mods:
+                    continue
+                state=Publisher.state(topic)
+                if state is None:
+                    continue
+                prev=Publisher.states.get(topic)
+                if prev == state:
+                    continue
+                Publisher.states[topic]=state
+                Publisher.emit(topic, {
+                    'changes': Publisher.diff(prev or {}, state)})
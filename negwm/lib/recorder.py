@@ -0,0 +1,75 @@
+""" Session recorder. With `negwm --record FILE` every i3 event received (with per-handler durations), every i3 command sent and every
+MsgBroker request is appended to FILE as one compact JSON array per line. The first records of a session are the header and GET_TREE
+snapshot, so `negwm-replay` can feed the session back through the modules offline. Record layout:
+    ["h", t, {"version": str, "mods": [str]}]       session header
+    ["t", t, tree]                                  GET_TREE snapshot
+    ["e", t, base, event, dt, [[handler, dt]...]]   i3 event
+    ["c", t, cmd, dt]                               i3 command
+    ["m", t, args, dt]                              MsgBroker request
+t is seconds since the session start, dt is seconds spent. """
+
+import json
+import threading
+import timeit
+from typing import Dict, List, Optional
+
+
+class Recorder():
+    current: Optional['Recorder']=None # active recorder, set by NegWM
+
+    def __init__(self, path: str) -> None:
+        self.path=path
+        self.lock=threading.Lock()
+        self.start=timeit.default_timer()
+        self.fp=open(path, 'a', encoding='utf8', buffering=1)
+
+    def now(self) -> float:
+        return round(timeit.default_timer() - self.start, 6)
+
+    def write(self, *record) -> None:
+        line=json.dumps(record, separators=(',', ':'), default=str)
+        with self.lock:
+            if not self.fp.closed:
+                self.fp.write(line + '\n')
+
+    def header(self, version: str, mods: List[str], tree: Dict) -> None:
+        self.write('h', self.now(), {'version': version, 'mods': mods})
+        self.write('t', self.now(), tree)
+
+    def event(self, base: str, event, start: float, handlers: List) -> None:
+        """ start: timer value before the first handler call.
+            handlers: list of (Stats key, duration). """
+        self.write(
+            'e', round(start - self.start, 6), base, event.ipc_data,
+            round(timeit.default_timer() - start, 6),
+            [[f'{mod}.{name}', round(dt, 6)] for (mod, name), dt in handlers])
+
+    def command(self, cmd: str, start: float) -> None:
+        self.write('c', round(start - self.start, 6), cmd,
+                   round(timeit.default_timer() - start, 6))
+
+    def request(self, args: List[str], start: float) -> None:
+        self.write('m', round(start - self.start, 6), args,
+                   round(timeit.default_timer() - start, 6))
+
+    def close(self) -> None:
+        with self.lock:
+            self.fp.close()
+
+    @staticmethod
+    def sessions(path: str) -> List[List]:
+        """ Read the log, returns list of sessions, every one is a list of
+        records starting with the header. Broken trailing line of the
+        interrupted session is skipped. """
+        ret: List[List]=[]
+        with open(path, encoding='utf8') as fp:
+            for line in fp:
+                try:
+                    record=json.loads(line)
+                except ValueError:
+                    continue
+                if record[0] == 'h':
+                    ret.append([])
+                if ret:
+                    ret[-1].append(record)
+        return ret
@@ -0,0 +1,138 @@
+""" Compiled command router. Modules declare their public commands once with the @command decorator: name, arity and argument
+converters. NegWM compiles them at load time into one dispatch table, which is used by both i3 bindings and MsgBroker socket messages.
+Binding strings are parsed once and memoized, so the keypress path is a dict lookup plus a call. Deferred modules are compiled on their
+first command. """
+
+import inspect
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from negwm.lib.stats import Stats
+
+
+def command(*converters: Callable):
+    """ Declare public module command. converters: argument converters in
+    positional order, str is used for the rest of arguments. """
+    def wrap(func):
+        func.negwm_command=converters
+        return func
+    return wrap
+
+
+def boolean(value: str) -> bool:
+    """ Converter for boolean command arguments. """
+    if isinstance(value, bool):
+        return value
+    return value.lower() in {'1', 'true', 'yes', 'on'}
+
+
+class Command():
+    """ Compiled command: bound method with arity and converters. """
+    __slots__=('func', 'required', 'total', 'converters', 'key')
+    positional={inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD}
+
+    def __init__(self, mod: str, name: str, func: Callable, converters: Tuple) -> None:
+        params=inspect.signature(func).parameters.values()
+        self.key=(mod, name) # Stats key
+        args=[p for p in params if p.kind in Command.positional]
+        self.func=func
+        self.required=sum(1 for p in args if p.default is p.empty)
+        self.total=len(args)
+        if any(p.kind == inspect.Parameter.VAR_POSITIONAL for p in params):
+            self.total=None
+        self.converters=converters
+
+    def prepare(self, args: List[str]) -> Tuple:
+        """ Check arity and convert arguments, raises ValueError. """
+        if len(args) < self.required or \
+                (self.total is not None and len(args) > self.total):
+            raise ValueError(f'wrong number of arguments: {len(args)}')
+        conv=self.converters
+        return tuple(
+            conv[i](arg) if i < len(conv) else arg
+            for i, arg in enumerate(args)
+        )
+
+
+class Router():
+    def __init__(self) -> None:
+        self.table: Dict[str, Dict[str, Command]]={} # module -> name -> cmd
+        self.bindings: Dict[str, Optional[Tuple]]={} # binding -> (cmd, args)
+        self.lazy: Dict[str, Tuple[frozenset, Callable]]={} # deferred modules
+        self.lock=threading.RLock()
+
+    def add(self, name: str, mod) -> None:
+        """ Compile public commands of the loaded module. """
+        commands={}
+        for cls in reversed(type(mod).__mro__):
+            for attr, func in vars(cls).items():
+                converters=getattr(func, 'negwm_command', None)
+                if converters is not None:
+                    commands[attr]=Command(name, attr, getattr(mod, attr), converters)
+        self.table[name]=commands
+        self.bindings.clear()
+
+    def remove(self, name: str) -> None:
+        self.table.pop(name, None)
+        self.bindings.clear()
+
+    def defer(self, name: str, commands: List[str], loader: Callable) -> None:
+        """ Register module which is loaded on its first command.
+            commands: command names from the manifest.
+            loader: imports and constructs the module, then calls add(). """
+        self.lazy[name]=(frozenset(commands), loader)
+        self.bindings.clear()
+
+    def load(self, name: str) -> None:
+        """ Load deferred module now, no-op for the loaded ones. """
+        with self.lock:
+            entry=self.lazy.pop(name, None)
+            if entry is not None:
+                entry[1]()
+
+    def compile(self, mod: str, cmd: str, args: List[str]) -> Optional[Tuple]:
+        """ Resolve command and convert its arguments. Returns (Command, args)
+        or None, errors are logged. """
+        target=self.table.get(mod, {}).get(cmd)
+        if target is None and cmd in self.lazy.get(mod, ((),))[0]:
+            self.load(mod)
+            target=self.table.get(mod, {}).get(cmd)
+        if target is None:
+            logging.error(f'Unknown command: {mod} {cmd}')
+            return None
+        try:
+            return target, target.prepare(args)
+        except ValueError as err:
+            logging.error(f'Cannot call {mod} {cmd} {args}: {err}')
+            return None
+
+    def binding(self, cmd_str: str) -> Optional[Tuple]:
+        """ Compile binding command like `nop circle next web, mode "default"`
+        once and memoize it. Returns (Command, args) or None. """
+        try:
+            return self.bindings[cmd_str]
+        except KeyError:
+            pass
+        ret=None
+        cmd=cmd_str.split(',')[0].split()[1:]
+        if len(cmd) > 1 and (cmd[0] in self.table or cmd[0] in self.lazy):
+            ret=self.compile(cmd[0], cmd[1], cmd[2:])
+        self.bindings[cmd_str]=ret
+        return ret
+
+    def dispatch(self, mod: str, args: List[str]) -> Any:
+        """ Call module command from socket message args. """
+        if not args:
+            logging.error(f'No command given for {mod}')
+            return None
+        call=self.compile(mod, args[0], args[1:])
+        if call is None:
+            return None
+        return Router.run(call)
+
+    @staticmethod
+    def run(call: Tuple) -> Any:
+        """ Run compiled (Command, args) pair with latency accounting. """
+        cmd, args=call
+        return Stats.call(cmd.key, cmd.func, *args)
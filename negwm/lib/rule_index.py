@@ -0,0 +1,112 @@
+""" Shared index of the match rules of all modules. Exact factors (classw, instance, role) map window attribute values straight to the
+(module, tag) pairs which accept them, tags with regex or plain string factors are kept in a smaller fallback list checked one by one. A
+window is classified for every module at once. The same WM_CLASS/instance/role/title tuples come again and again (terminals, browsers,
+rescans after add_prop), so results are kept in a bounded LRU cache keyed by that tuple. The index and the cache are dropped when the config
+generation changes: on config (re)load and add_prop/del_prop. """
+
+import collections
+from typing import Dict, List, Tuple
+from negwm.lib.cfg import cfg
+
+
+class RuleIndex():
+    mods: Dict[str, object]={} # module name -> Matcher module
+    generation=-1 # config generation the index was built for
+    exact: Dict[str, Dict[str, List[Tuple]]]={} # attr -> value -> entries
+    fallback: List[Tuple]=[] # (entry, rules) of the tags with regexes
+    size=1024 # cached window attribute tuples
+    cache: collections.OrderedDict=collections.OrderedDict()
+    hits, misses=0, 0
+    by_name=False # some tag has name_r rules, title is a part of the key
+
+    @staticmethod
+    def register(mod) -> None:
+        """ Add module or replace it after reinitialization. """
+        RuleIndex.mods[mod.__class__.__name__]=mod
+        RuleIndex.generation=-1
+
+    @staticmethod
+    def build() -> None:
+        """ Entries are (position, module, tag), position keeps the config
+        order of tags inside the module. """
+        exact: Dict[str, Dict[str, List[Tuple]]]={}
+        fallback=[]
+        for name, mod in RuleIndex.mods.items():
+            for pos, tag in enumerate(mod.cfg):
+                rules=mod.tag_rules(tag)
+                if rules is None:
+                    continue
+                entry=(pos, name, tag)
+                for attr, values in rules.sets:
+                    index=exact.setdefault(attr, {})
+                    for value in values:
+                        index.setdefault(value, []).append(entry)
+                if rules.patterns or rules.within:
+                    fallback.append((entry, rules))
+        RuleIndex.exact, RuleIndex.fallback=exact, fallback
+        RuleIndex.by_name=any(
+            attr == 'name' for _, rules in fallback for attr, _ in rules.patterns)
+        RuleIndex.generation=cfg.generation
+        RuleIndex.cache.clear()
+
+    @staticmethod
+    def key(win) -> Tuple:
+        return (win.window_class, win.window_instance, win.window_role,
+                win.name if RuleIndex.by_name else None)
+
+    @staticmethod
+    def classify(win) -> Dict[str, List[str]]:
+        """ Module name -> tags matching the window, in config order. The
+        result is shared, callers must not modify it. """
+        if RuleIndex.generation != cfg.generation:
+            RuleIndex.build()
+        key=RuleIndex.key(win)
+        cache=RuleIndex.cache
+        ret=cache.get(key)
+        if ret is not None:
+            RuleIndex.hits+=1
+            cache.move_to_end(key)
+            return ret
+        RuleIndex.misses+=1
+        entries=set()
+        for attr, index in RuleIndex.exact.items():
+            entries.update(index.get(getattr(win, attr), ()))
+        for entry, rules in RuleIndex.fallback:
+            if entry not in entries and rules.search(win):
+                entries.add(entry)
+        ret={}
+        for _, name, tag in sorted(entries):
+            ret.setdefault(name, []).append(tag)
+        cache[key]=ret
+        if len(cache) > RuleIndex.size:
+            cache.popitem(last=False)
+        return ret
+
+    @staticmethod
+    def classify_all(wins) -> Dict[int, Dict[str, List[str]]]:
+        """ Window id -> module name -> matching tags for the whole window
+        list in one pass. Windows with the same attributes are classified
+        once, so startup and rescans cost one lookup per distinct window
+        kind, whatever number of modules and tags. """
+        if RuleIndex.generation != cfg.generation:
+            RuleIndex.build()
+        groups: Dict[Tuple, Dict[str, List[str]]]={}
+        ret={}
+        for win in wins:
+            key=RuleIndex.key(win)
+            result=groups.get(key)
+            if result is None:
+                result=groups[key]=RuleIndex.classify(win)
+            ret[win.id]=result
+        return ret
+
+    @staticmethod
+    def stats() -> Dict:
+        lookups=RuleIndex.hits + RuleIndex.misses
+        return {
+            'hits': RuleIndex.hits,
+            'misses': RuleIndex.misses,
+            'hit_ratio': round(RuleIndex.hits / lookups, 3) if lookups else 0.0,
+            'cached': len(RuleIndex.cache),
+            'generation': RuleIndex.generation,
+        }
@@ -0,0 +1,51 @@
+""" Small persistent cache for the results of slow startup probes: i3 config location and health checks. Stored as json in
+$XDG_CACHE_HOME/negwm/startup.json. """
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+
+class StartupCache():
+    lock=threading.Lock()
+    data: Optional[Dict]=None
+
+    @staticmethod
+    def path() -> str:
+        cache_home=os.environ.get('XDG_CACHE_HOME', '') or \
+            os.path.expanduser('~/.cache')
+        return f'{cache_home}/negwm/startup.json'
+
+    @staticmethod
+    def load() -> Dict:
+        if StartupCache.data is None:
+            try:
+                with open(StartupCache.path(), encoding='utf8') as fp:
+                    StartupCache.data=json.load(fp)
+            except (OSError, ValueError):
+                StartupCache.data={}
+        return StartupCache.data
+
+    @staticmethod
+    def get(key: str, default: Any=None) -> Any:
+        with StartupCache.lock:
+            return StartupCache.load().get(key, default)
+
+    @staticmethod
+    def set(key: str, value: Any) -> None:
+        """ Store value, the file is replaced atomically. """
+        with StartupCache.lock:
+            data=StartupCache.load()
+            data[key]=value
+            path=StartupCache.path()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp=tempfile.mkstemp(dir=os.path.dirname(path))
+                with os.fdopen(fd, 'w', encoding='utf8') as fp:
+                    json.dump(data, fp)
+                os.replace(tmp, path)
+            except OSError as err:
+                logging.error(f'Cannot write startup cache {path}: {err}')
@@ -0,0 +1,132 @@
+""" Runtime latency instrumentation. Every i3 event handler and every command dispatched from bindings or the socket is timed into a fixed
+size histogram per (module, handler), together with the number of i3 round trips it made. `stats` socket command returns the report. """
+
+import math
+import threading
+import timeit
+from typing import Callable, Dict, Tuple
+
+import i3ipc
+from i3ipc.connection import MessageType
+
+from negwm.lib.batch import CommandBatch
+from negwm.lib.recorder import Recorder
+
+
+class Histogram():
+    """ Fixed size log-scale histogram: 4 buckets per power of two starting
+    from 1us, so 96 buckets cover everything up to ~16s. """
+    size=96
+    __slots__=('buckets', 'calls', 'round_trips', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.buckets=[0] * Histogram.size
+        self.calls, self.round_trips, self.total, self.max=0, 0, 0.0, 0.0
+
+    def add(self, dt: float, round_trips: int) -> None:
+        usec=dt * 1e6
+        idx=int(4 * math.log2(usec)) if usec > 1.0 else 0
+        self.buckets[min(idx, Histogram.size - 1)]+=1
+        self.calls+=1
+        self.round_trips+=round_trips
+        self.total+=dt
+        if dt > self.max:
+            self.max=dt
+
+    def percentile(self, q: float) -> float:
+        """ Upper bound of the bucket with q-th percentile, in ms. """
+        target, seen=q * self.calls, 0
+        for idx, count in enumerate(self.buckets):
+            seen+=count
+            if count and seen >= target:
+                usec=min(2 ** ((idx + 1) / 4), self.max * 1e6)
+                return round(usec / 1e3, 3)
+        return 0.0
+
+    def report(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': round(self.max * 1e3, 3),
+            'avg': round(self.total * 1e3 / self.calls, 3) if self.calls else 0.0,
+            'round_trips': self.round_trips,
+        }
+
+
+class Stats():
+    histograms: Dict[Tuple[str, str], Histogram]={}
+    providers: Dict[str, Callable]={} # extra stats sources: tree cache, etc
+    local=threading.local() # i3 round trips made by the current thread
+
+    @staticmethod
+    def round_trips() -> int:
+        return getattr(Stats.local, 'round_trips', 0)
+
+    @staticmethod
+    def count_round_trip() -> None:
+        Stats.local.round_trips=Stats.round_trips() + 1
+
+    @staticmethod
+    def key(handler: Callable) -> Tuple[str, str]:
+        owner=getattr(handler, '__self__', None)
+        mod=owner.__class__.__name__ if owner is not None else 'negwm'
+        return mod, getattr(handler, '__name__', str(handler))
+
+    @staticmethod
+    def call(key: Tuple[str, str], func: Callable, *args):
+        """ Call func and account its latency and i3 round trips to key.
+        Awaitables are wrapped to be accounted on completion. """
+        rt_start, start=Stats.round_trips(), timeit.default_timer()
+        try:
+            ret=func(*args)
+        finally:
+            Stats.add(key, timeit.default_timer() - start,
+                      Stats.round_trips() - rt_start)
+        if hasattr(ret, '__await__'):
+            return Stats.timed_await(key, ret)
+        return ret
+
+    @staticmethod
+    async def timed_await(key: Tuple[str, str], awaitable):
+        start=timeit.default_timer()
+        try:
+            return await awaitable
+        finally:
+            Stats.add((key[0], f'{key[1]}:await'), timeit.default_timer() - start, 0)
+
+    @staticmethod
+    def add(key: Tuple[str, str], dt: float, round_trips: int) -> None:
+        hist=Stats.histograms.get(key)
+        if hist is None:
+            hist=Stats.histograms.setdefault(key, Histogram())
+        hist.add(dt, round_trips)
+
+    @staticmethod
+    def report() -> Dict:
+        ret={
+            f'{mod}.{handler}': hist.report()
+            for (mod, handler), hist in sorted(Stats.histograms.items())
+        }
+        for name, provider in Stats.providers.items():
+            ret[name]=provider()
+        return ret
+
+
+class Connection(i3ipc.Connection):
+    """ i3ipc connection which counts round trips for Stats and passes sent
+    commands to the session recorder. Commands batched in the asyncio
+    runtime and not sent yet are sent before any request. """
+    def _message(self, message_type, payload):
+        if CommandBatch.pending: # queued on the loop, should go first
+            CommandBatch.send_pending(self)
+        Stats.count_round_trip()
+        recorder=Recorder.current
+        if recorder is None or message_type != MessageType.COMMAND:
+            return super()._message(message_type, payload)
+        start=timeit.default_timer()
+        try:
+            return super()._message(message_type, payload)
+        finally:
+            recorder.command(payload, start)
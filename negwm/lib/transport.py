@@ -0,0 +1,143 @@
+""" Transport of the negwm command socket. By default it is a Unix socket $XDG_RUNTIME_DIR/negwm/negwm.sock, accessible only for the user
+running negwm: the directory and socket are private and every connection is checked with SO_PEERCRED. TCP on localhost is enabled only
+explicitly, by setting $NEGWM_TCP to the port number, both for the server and for the clients.
+
+Connection speaks the plain line protocol (one command per line, JSON reply, connection is closed after the first reply) unless its first
+line is the hello: `frames` followed by the reply encodings client accepts, see Codec. Server answers with `frames <encoding>` line, then
+both sides exchange frames: request id and payload length as two network order uint32, then the payload. Request payload is the command
+line, every request gets exactly one reply frame with its id, in completion order, so clients can pipeline requests over one persistent
+connection. Empty reply payload means no result. """
+
+import asyncio
+import logging
+import os
+import socket
+import stat
+import struct
+from typing import Optional
+
+
+class Frame():
+    hello=b'frames'
+    header=struct.Struct('!II')
+    max_request=1 << 20 # commands are short, reject garbage early
+
+    @staticmethod
+    def hello_line(encodings) -> bytes:
+        return b' '.join([Frame.hello, *(e.encode() for e in encodings)]) + b'\n'
+
+    @staticmethod
+    def parse_hello(line: bytes):
+        """ Returns list of encodings from the hello line, None when it is
+        not the hello. """
+        words=line.decode('utf8', 'replace').split()
+        if not words or words[0] != Frame.hello.decode():
+            return None
+        return words[1:]
+
+    @staticmethod
+    def pack(req_id: int, payload: bytes) -> bytes:
+        return Frame.header.pack(req_id, len(payload)) + payload
+
+    @staticmethod
+    async def read(reader, limit: int=0):
+        """ Returns (request id, payload), raises IncompleteReadError on
+        the connection end. """
+        req_id, size=Frame.header.unpack(
+            await reader.readexactly(Frame.header.size))
+        if limit and size > limit:
+            raise ValueError(f'frame too large: {size}')
+        return req_id, await reader.readexactly(size)
+
+
+class Transport():
+    connect_timeout=1.0
+
+    @staticmethod
+    def path() -> str:
+        runtime_dir=os.environ.get('XDG_RUNTIME_DIR', '') or \
+            f'/tmp/negwm-{os.getuid()}'
+        return f'{runtime_dir}/negwm/negwm.sock'
+
+    @staticmethod
+    def tcp_port() -> Optional[int]:
+        """ TCP port from $NEGWM_TCP, None when TCP is not configured. """
+        port=os.environ.get('NEGWM_TCP', '')
+        try:
+            return int(port) if port else None
+        except ValueError:
+            logging.error(f'Bad NEGWM_TCP value: {port}')
+            return None
+
+    @staticmethod
+    def peer_uid(writer):
+        """ Returns (pid, uid) of the Unix socket peer, None for TCP. """
+        sock=writer.get_extra_info('socket')
+        if sock is None or sock.family != socket.AF_UNIX:
+            return None
+        creds=sock.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        pid, uid, _=struct.unpack('3i', creds)
+        return pid, uid
+
+    @staticmethod
+    def peer_allowed(writer) -> bool:
+        """ Unix socket peer should be the same user, TCP is allowed only
+        when it was configured explicitly. """
+        peer=Transport.peer_uid(writer)
+        if peer is None or peer[1] == os.getuid():
+            return True
+        logging.warning(f'Rejected connection from pid {peer[0]} uid {peer[1]}')
+        return False
+
+    @staticmethod
+    def private_dir(path: str) -> None:
+        """ Create directory only the current user can access, or check that
+        the existing one is such: a real directory owned by us with no
+        group/other permissions. Anything else may be controlled by another
+        user who could then replace the socket, so it is refused. """
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        st=os.lstat(path)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() \
+                or stat.S_IMODE(st.st_mode) & 0o077:
+            raise PermissionError(
+                f'{path}: must be a directory owned by uid {os.getuid()} '
+                f'with mode 0700, got uid {st.st_uid} mode '
+                f'{oct(stat.S_IMODE(st.st_mode))}')
+
+    @staticmethod
+    async def start_servers(handler, port: Optional[int]=None):
+        """ Start Unix socket server and TCP one if port is given. Returns
+        list of servers. """
+        path=Transport.path()
+        sock_dir=os.path.dirname(path)
+        if not os.environ.get('XDG_RUNTIME_DIR', ''): # shared /tmp fallback
+            Transport.private_dir(os.path.dirname(sock_dir))
+        Transport.private_dir(sock_dir)
+        try:
+            os.unlink(path) # stale socket, negwm itself is single instance
+        except FileNotFoundError:
+            pass
+        servers=[await asyncio.start_unix_server(handler, path)]
+        os.chmod(path, 0o600)
+        if port is not None:
+            servers.append(
+                await asyncio.start_server(handler, 'localhost', port))
+        return servers
+
+    @staticmethod
+    async def connect(timeout: float=0.0):
+        """ Open (reader, writer) to negwm. """
+        timeout=timeout or Transport.connect_timeout
+        port=Transport.tcp_port()
+        if port is not None:
+            conn=asyncio.open_connection('localhost', port)
+        else:
+            conn=asyncio.open_unix_connection(Transport.path())
+        reader, writer=await asyncio.wait_for(conn, timeout=timeout)
+        peer=Transport.peer_uid(writer)
+        if peer is not None and peer[1] != os.getuid():
+            writer.close()
+            raise ConnectionError(
+                f'negwm socket is served by uid {peer[1]}, not by us')
+        return reader, writer
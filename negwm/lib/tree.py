@@ -0,0 +1,191 @@
+""" Shared i3 tree cache. NegWM owns one instance of it and keeps it up to date from window, workspace and output events. Modules query it
+via extension.tree() / extension.focused() instead of calling get_tree() themselves, so GET_TREE happens only when the cache cannot be
+patched from the event itself or when drift from the real i3 state is detected. """
+
+import logging
+import threading
+from typing import Dict, List
+
+import i3ipc
+
+
+class TreeCache():
+    """ Incrementally maintained copy of the i3 layout tree.
+    Focus, close and property-only window events are applied in place. Structural window changes (new, move, floating), any workspace or
+    output event only mark the cache stale, so the next query re-syncs it once instead of every handler calling GET_TREE on its own.
+    i3 sends no event at all for layout, split direction and tiling size changes, so any binding or foreign tick (i3 sends the binding event
+    after running its command) also marks the cache stale. Changes made by plain `i3-msg` are still invisible: layout and rect readers
+    should ask for sync=True. """
+    # Window events which only change properties of an already known container.
+    props_events={'title', 'mark', 'urgent', 'fullscreen_mode'}
+    # Container attributes refreshed from the event container.
+    props_attrs=(
+        'name', 'marks', 'urgent', 'fullscreen_mode', 'rect', 'ipc_data',
+        'window_title', 'window_class', 'window_instance', 'window_role',
+    )
+
+    own_ticks='negwm-' # payload prefix of the ticks negwm sends itself
+
+    def __init__(self, i3) -> None:
+        self.i3ipc=i3
+        self.root=None
+        self.index: Dict[int, object]={}    # con_id -> Con
+        self.focused_id=None
+        self.dirty=True
+        self.invalidations=0
+        self.fetch=None # asyncio runtime: coroutine GET_TREE on the aio connection
+        self.lock=threading.RLock()
+        self.syncs, self.hits, self.patches, self.refreshes=0, 0, 0, 0
+
+    def subscribe(self, on, fetch=None) -> None:
+        """ Subscribe to i3 events, on: Dispatcher.on or Connection.on
+            fetch: Dispatcher.get_tree in the asyncio runtime, stale cache is
+            refreshed with it before module handlers run. """
+        on('window', self.on_window)
+        on('workspace', self.invalidate)
+        on('output', self.invalidate)
+        on('binding', self.invalidate)
+        on('tick', self.on_tick)
+        self.fetch=fetch
+        if fetch is not None:
+            for event in ('window', 'workspace', 'output', 'binding', 'tick'):
+                on(event, self.refresh)
+
+    def sync(self) -> None:
+        """ Fetch the whole tree with GET_TREE and rebuild the index. """
+        with self.lock:
+            self.install(self.i3ipc.get_tree())
+            self.syncs+=1
+
+    async def refresh(self, *_) -> None:
+        """ Re-sync stale cache without blocking the loop. Containers are
+        rebuilt on the blocking connection, so con.command() stays
+        synchronous for module code. Cache invalidated again while waiting
+        for i3 stays stale. """
+        if not self.dirty and self.root is not None:
+            return
+        invalidations=self.invalidations
+        root=await self.fetch()
+        with self.lock:
+            if invalidations != self.invalidations:
+                return
+            self.install(i3ipc.Con(root.ipc_data, None, self.i3ipc))
+            self.refreshes+=1
+
+    def install(self, root) -> None:
+        with self.lock:
+            self.root=root
+            self.index={con.id: con for con in self.root}
+            self.index[self.root.id]=self.root
+            focused=self.root.find_focused()
+            self.focused_id=focused.id if focused is not None else None
+            self.dirty=False
+
+    def on_tick(self, _, event) -> None:
+        """ Executor wakeups and other negwm ticks change nothing. """
+        if not (event.payload or '').startswith(TreeCache.own_ticks):
+            self.invalidate()
+
+    def invalidate(self, *_) -> None:
+        """ Mark cache stale, next query re-syncs it. """
+        self.dirty=True
+        self.invalidations+=1
+
+    def get(self, sync: bool=False):
+        """ Return the root container.
+            sync (bool): force GET_TREE, for example to read fresh rects. """
+        with self.lock:
+            if sync or self.dirty or self.root is None:
+                self.sync()
+            else:
+                self.hits+=1
+            return self.root
+
+    def leaves(self) -> List:
+        return self.get().leaves()
+
+    def find_fullscreen(self) -> List:
+        return self.get().find_fullscreen()
+
+    def find_focused(self, sync: bool=False):
+        """ Return focused container, re-sync when the cached focus looks
+        inconsistent. """
+        with self.lock:
+            root=self.get(sync)
+            con=self.index.get(self.focused_id)
+            if con is not None and con.focused:
+                return con
+            con=root.find_focused()
+            if con is None and not sync:
+                logging.debug('tree cache: focus drift, resync')
+                con=self.get(sync=True).find_focused()
+            if con is not None:
+                self.focused_id=con.id
+            return con
+
+    def on_window(self, _, event) -> None:
+        """ Apply window event to the cached tree. """
+        with self.lock:
+            if self.dirty or self.root is None:
+                return
+            change=event.change
+            con=self.index.get(event.container.id)
+            if change == 'close':
+                if con is not None:
+                    self.detach(con)
+            elif con is None:
+                # Unknown container: new window or we missed something.
+                self.invalidate()
+            elif change == 'focus':
+                self.set_focus(con)
+            elif change in TreeCache.props_events:
+                for attr in TreeCache.props_attrs:
+                    setattr(con, attr, getattr(event.container, attr))
+                self.patches+=1
+            else:
+                self.invalidate()
+
+    def set_focus(self, con) -> None:
+        prev=self.index.get(self.focused_id)
+        if prev is not None:
+            prev.focused=False
+        con.focused=True
+        self.focused_id=con.id
+        child, parent=con, con.parent
+        while parent is not None:
+            if parent.focus and parent.focus[0] != child.id:
+                if child.id in parent.focus:
+                    parent.focus.remove(child.id)
+                parent.focus.insert(0, child.id)
+            child, parent=parent, parent.parent
+        self.patches+=1
+
+    def detach(self, con) -> None:
+        """ Remove closed container and the split/floating containers which
+        i3 destroys together with their last child. """
+        while True:
+            parent=con.parent
+            for con_id in [c.id for c in con] + [con.id]:
+                self.index.pop(con_id, None)
+            if con.id == self.focused_id:
+                con.focused=False
+                self.focused_id=None
+            if parent is None:
+                break
+            if con in parent.nodes:
+                parent.nodes.remove(con)
+            elif con in parent.floating_nodes:
+                parent.floating_nodes.remove(con)
+            if parent.focus and con.id in parent.focus:
+                parent.focus.remove(con.id)
+            if parent.type not in {'con', 'floating_con'} \
+                    or parent.nodes or parent.floating_nodes or parent.window:
+                break
+            con=parent
+        self.patches+=1
+
+    def stats(self) -> Dict:
+        return {
+            'syncs': self.syncs, 'hits': self.hits, 'patches': self.patches,
+            'refreshes': self.refreshes,
+        }
@@ -2,13 +2,19 @@
 instances via pid-log.
 
 Usage:
-    ./main.py [-diqv]
+    ./main.py [-adiqv] [-r FILE]
+    ./main.py compile [-p]
+    ./main.py -a, --aio
+    ./main.py -r FILE, --record=FILE
     ./main.py -d, --debug
     ./main.py -i, --info
     ./main.py -q, --quiet
     ./main.py -v, --verbose
 
 Options:
+    -a, --aio         Run i3 events, config watchers and socket server on the single asyncio loop
+    -r, --record=FILE Append every i3 event, i3 command and socket request to FILE, see negwm-replay
+    -p, --print       compile: print generated i3 config instead of writing it
     -d, --debug       Enable debug mode with debug logging
     -i, --info        Info logging
     -q, --quiet       Quiet, no logging
@@ -26,7 +32,6 @@ import importlib
 import os
 import pathlib
 import signal
-import subprocess
 import sys
 from threading import Thread
 import timeit
@@ -35,26 +40,39 @@ import atexit
 from docopt import docopt
 import logging
 
-from asyncinotify import Inotify, Mask
-import i3ipc
 import psutil
 from rich.traceback import install
 from rich.console import Console
 
 from negwm.__about__ import __version__
+from negwm.lib.cfg import cfg
+from negwm.lib.cfg_persister import CfgPersister
+from negwm.lib.cfg_watcher import ConfigWatcher
 from negwm.lib.checker import checker
+from negwm.lib.dispatcher import Dispatcher
+from negwm.lib.executor import Executor
+from negwm.lib.extension import extension
 from negwm.lib.locker import get_lock
+from negwm.lib.manifest import Manifest
 from negwm.lib.misc import Misc
 from negwm.lib.msgbroker import MsgBroker
+from negwm.lib.recorder import Recorder
+from negwm.lib.router import Router
+from negwm.lib.rule_index import RuleIndex
+from negwm.lib.stats import Connection, Stats
+from negwm.lib.transport import Transport
+from negwm.lib.tree import TreeCache
+from negwm.lib.batch import CommandBatch
 
 install(show_locals=True)
 console=Console(log_time=True)
 
 class NegWM():
-    def __init__(self):
+    def __init__(self, aio=False):
         """ Init function
             Using of self.intern for better performance, create i3ipc
             connection, connects to the asyncio eventloop.
+            aio (bool): use single asyncio loop runtime instead of threads.
         """
         loop=asyncio.new_event_loop()
 
@@ -71,7 +89,7 @@ class NegWM():
 
         super().__init__()
 
-        self.loop, self.mods=loop, {}
+        self.loop, self.mods, self.aio=loop, {}, aio
         blacklist={'__init__'}
         dirname=os.path.dirname
         mods=map(
@@ -83,24 +101,59 @@ class NegWM():
                 name=str(mod.name).removesuffix('.py')
                 if name not in blacklist:
                     self.mods[sys.intern(name)]=None
-        self.port=15555
+        self.port=Transport.tcp_port() # TCP only when configured explicitly
         # main i3ipc connection created here and can be bypassed to the most of
         # modules here.
-        self.i3=i3ipc.Connection()
-        self.i3.on('binding', self.handle_bindings)
+        self.i3=Connection()
+        # All i3 events go through one dispatcher, so the same module handlers
+        # work for both threaded and asyncio runtimes.
+        self.events=Dispatcher(self.i3, self.loop)
+        extension.dispatcher=self.events
+        # Shared tree cache should be subscribed before any module handler, so
+        # modules always see the tree with the current event applied.
+        self.tree=TreeCache(self.i3)
+        self.tree.subscribe(self.events.on, self.events.get_tree if aio else None)
+        extension.tree_cache=self.tree
+        Stats.providers['tree']=self.tree.stats
+        Stats.providers['batch']=CommandBatch.stats
+        Stats.providers['handlers']=self.events.counts
+        Stats.providers['rules']=RuleIndex.stats
+        self.router=Router()
+        extension.router=self.router
+        self.events.on('binding', self.handle_bindings)
+        # Threaded runtime: socket commands and config reloads are executed
+        # on the i3 event thread, in arrival order.
+        self.executor=None if aio else Executor(self.i3)
+        if self.executor is not None:
+            self.executor.subscribe(self.events.on)
+            Stats.providers['executor']=self.executor.stats
+        extension.executor=self.executor
 
     @staticmethod
     def cleanup():
+        CfgPersister.flush()
+        if Recorder.current is not None:
+            Recorder.current.close()
         NegWM.kill_proctree(os.getpid())
 
+    def record(self, path):
+        """ Start session recording, the log starts with the list of modules
+        and the tree snapshot they are started with. """
+        Recorder.current=Recorder(path)
+        Recorder.current.header(
+            __version__, list(self.mods), self.i3.get_tree().ipc_data)
+
     @staticmethod
     def main():
         """ Run negwm from here """
+        arguments=docopt(str(__doc__), version=__version__)
+        if arguments['compile']:
+            NegWM.compile(arguments['--print'])
+            return
         checker().check()
         get_lock(os.path.basename(__file__))
         # We need it because of thread_wait on Ctrl-C.
         atexit.register(NegWM.cleanup)
-        arguments=docopt(str(__doc__), version=__version__)
         log=logging.getLogger()
         loglevel=logging.INFO
         if arguments['--debug'] or arguments['--verbose']:
@@ -111,24 +164,47 @@ class NegWM():
             loglevel=logging.CRITICAL
         else:
             log.setLevel(loglevel)
-        wm=NegWM()
-        wm.update_i3_config()
+        wm=NegWM(aio=arguments['--aio'])
+        if arguments['--record']:
+            wm.record(arguments['--record'])
         wm.startup()
 
+    @staticmethod
+    def compile(print_only=False):
+        """ Generate i3 config ahead of time without running daemon. Only
+        configurator and the modules it generates rules for are created,
+        from their configs, so no X session is needed. i3 is reloaded only
+        when it runs and the config changed. """
+        dirname=os.path.dirname
+        mods={}
+        for path in sorted(glob.glob(f"{dirname(dirname(__file__))}/negwm/modules/*.py")):
+            name=pathlib.Path(path).name.removesuffix('.py')
+            mods[name]=None
+            if name == 'configurator' or name in Manifest.rules():
+                mod_cls=getattr(importlib.import_module('negwm.modules.' + name), name)
+                mods[name]=mod_cls.from_config()
+        MsgBroker.mods=mods
+        configurator=mods['configurator']
+        if print_only:
+            configurator.print()
+            return
+        try:
+            configurator.i3ipc=Connection()
+        except Exception:
+            logging.info('i3 is not running, config is written without reload')
+        configurator.write_async().result()
+
     def handle_bindings(self, _, event):
-        data=event.ipc_data
-        if data:
-            cmd_str=data['binding']['command']
-            if cmd_str[:3] == 'nop':
-                cmd=cmd_str.split(',')[0].split()[1:]
-                mod=cmd[0]
-                if mod in self.mods:
-                    args=' '.join(cmd[2:]).split(',')[0].split()
-                    mod_cmd=cmd[1]
-                    try:
-                        getattr(self.mods[mod], mod_cmd)(*args)
-                    except TypeError:
-                        logging.info(f'Cannot call mod={self.mods[mod]} cmd={mod_cmd} args=({args})')
+        """ Run negwm command from `nop <mod> <cmd> <args>` binding. Other
+        bindings are rejected before any parsing, compiled ones are memoized
+        by the router. """
+        cmd_str=event.binding.command
+        if not cmd_str.startswith('nop '):
+            return None
+        call=self.router.binding(cmd_str)
+        if call is not None:
+            return Router.run(call) # awaitable is run by the dispatcher
+        return None
 
     @staticmethod
     def kill_proctree(pid, including_parent=True):
@@ -144,73 +220,94 @@ class NegWM():
         """ Load modules.
             This function init MsgBroker, use importlib to load all the
             stuff, then add_ipc and update notification with startup
-            benchmarks.
+            benchmarks. Purely command-driven modules from the manifest are
+            deferred until their first command.
         """
         mod_startup_times=[]
+        deferred=[]
         console.status("[bold green]Loading...")
         for mod in self.mods:
-            start_time=timeit.default_timer()
-            i3mod=importlib.import_module('negwm.modules.' + mod)
-            self.mods[mod]=getattr(i3mod, mod)(self.i3)
-            try:
-                self.mods[mod].asyncio_init(self.loop)
-            except Exception:
-                pass
-            dt=timeit.default_timer() - start_time
-            mod_startup_times.append(dt)
-            logging.debug(f'{mod}: {round(dt,4)}')
-            console.log(f"{mod}: {round(dt,5)}")
+            if Manifest.lazy(mod):
+                self.router.defer(
+                    mod, Manifest.commands(mod),
+                    functools.partial(self.load_module, mod, True))
+                deferred.append(mod)
+                continue
+            mod_startup_times.append(self.load_module(mod))
         total_startup_time=str(round(sum(mod_startup_times), 6))
-        loading_time_msg=f'Total {total_startup_time}'
+        loading_time_msg=f'Total {total_startup_time}, ' \
+            f'deferred {len(deferred)} of {len(self.mods)}: {", ".join(deferred)}'
         logging.debug(loading_time_msg)
         console.log(loading_time_msg)
 
-    def update_i3_config(self):
-        binpath=f'{os.path.dirname(__file__)}/bin/'
-        proc=subprocess.Popen(
-            [f'{binpath}/create_cfg'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+    def load_module(self, mod, on_demand=False):
+        """ Import and construct module, returns the time it took. """
+        start_time=timeit.default_timer()
+        i3mod=importlib.import_module('negwm.modules.' + mod)
+        self.mods[mod]=getattr(i3mod, mod)(self.i3)
+        self.router.add(mod, self.mods[mod])
         try:
-            out,err=proc.communicate(timeout=5)
-        except subprocess.TimeoutExpired:
-            proc.kill()
-            out,err=proc.communicate()
-        for fd in out,err:
-            if fd:
-                for line in fd.splitlines():
-                    if line:
-                        logging.info(line.decode())
+            self.mods[mod].asyncio_init(self.loop)
+        except Exception:
+            pass
+        dt=timeit.default_timer() - start_time
+        Manifest.check(
+            mod, self.router.table[mod], self.events.subscriptions(mod))
+        suffix=' (on demand)' if on_demand else ''
+        logging.debug(f'{mod}: {round(dt,4)}{suffix}')
+        console.log(f"{mod}: {round(dt,5)}{suffix}")
+        return dt
+
+    def update_i3_config(self):
+        """ Generate i3 config in-process via configurator, on the thread
+        handling i3 events. Unchanged result is not written and does not
+        reload i3. """
+        self.call_on_events(extension.update_i3_config)
+
+    def call_on_events(self, func, *args, **kwargs):
+        """ Run module code where i3 events are handled: on the event thread
+        in the threaded runtime, right here in the asyncio one. """
+        if self.executor is None:
+            func(*args, **kwargs)
+        else:
+            self.executor.submit(functools.partial(func, *args, **kwargs))
+
+    def reload_mods(self, changed, reload_one=True):
+        """ Reload modules with changed configs. Reload only appropriate
+        config by default.
+            changed: modules whose config content changed. """
+        # Deferred modules read the fresh config on load, reload of the
+        # loaded ones regenerates i3 config.
+        mods=changed if reload_one else list(self.mods)
+        reloaded=[m for m in mods if self.mods.get(m) is not None]
+        for mod in reloaded:
+            self.mods[mod].reload()
+        if not reloaded:
+            extension.update_i3_config()
 
     async def cfg_mods_worker(self, reload_one=True):
-        """ Reloading configs on change. Reload only appropriate config by default.
-            watcher: watcher for cfg. """
-        config_extension='.cfg'
-        while True:
-            with Inotify() as inotify:
-                inotify.add_watch(
-                    f'{Misc.cfg_path()}/', Mask.MODIFY)
-                async for event in inotify:
-                    changed_mod=str(event.name).removesuffix(config_extension)
-                    if changed_mod in self.mods:
-                        self.update_i3_config()
-                        if reload_one:
-                            self.mods[changed_mod].reload()
-                        else:
-                            for mod in self.mods:
-                                self.mods[mod].reload()
+        """ Reloading configs on change. Bursts of writes are coalesced,
+        writes of negwm itself and saves without content changes are
+        ignored. """
+        watcher=ConfigWatcher(
+            Misc.cfg_path(), self.mods,
+            functools.partial(
+                self.call_on_events, self.reload_mods, reload_one=reload_one))
+        await watcher.run()
 
     def run_config_watchers(self):
         """ Start all watchers in background via ensure_future """
         self.loop.create_task(self.cfg_mods_worker())
 
-    def dump_i3_config(self):
-        getattr(self.mods['configurator'], 'write')()
-        subprocess.run(['i3-msg', 'reload'])
-
     def startup(self):
         """ Run negwm here. """
+        if self.aio:
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.startup_aio())
+            except KeyboardInterrupt:
+                pass
+            return
         def start(func, args=None):
             """ Helper for pretty-printing of loading process.
                 func (callable): callable routine to run.
@@ -225,15 +322,33 @@ class NegWM():
         # Start modules mainloop.
         mainloop=Thread(
             target=MsgBroker.mainloop,
-            args=(self.loop, self.mods, self.port,),
+            args=(self.loop, self.mods, self.router, self.port, self.executor),
             daemon=True
         )
         start((mainloop).start)
 
-        if Misc.i3_cfg_need_dump():
-            self.dump_i3_config()
+        self.update_i3_config()
 
         try:
             self.i3.main()
         except KeyboardInterrupt:
             self.i3.main_quit()
+
+    async def startup_aio(self):
+        """ Run negwm with i3ipc.aio: i3 events, inotify config watchers and
+        MsgBroker server share this loop, so module state is never touched
+        from two threads. Module handlers stay plain functions, the i3
+        traffic of the event path goes through the aio connection: the tree
+        cache is refreshed before they run and command batches are sent
+        after each handler and socket command. Still blocking the loop: direct
+        con.command()/i3ipc.command() calls of the socket commands (circle
+        focus, run-or-raise exec), tree(sync=True) reads of floating rects
+        and the X11 property reads of NegEWMH. """
+        await self.events.attach_aio()
+        CommandBatch.deferred=True
+        self.load_modules()
+        self.run_config_watchers()
+        await MsgBroker.start(
+            self.mods, self.router, self.port, dispatcher=self.events)
+        self.update_i3_config()
+        await self.events.aio.main()
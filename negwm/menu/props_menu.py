@@ -4,7 +4,6 @@ import re
 import socket
 import logging
 import asyncio
-import pickle
 import sys
 from typing import List
 import i3ipc
@@ -74,7 +73,7 @@ class props():
             if mod is None or not mod:
                 return
             echo=reflection.echo
-            mod_cfg = pickle.loads(await echo(f'{mod} get_config\n'))
+            mod_cfg = await echo(f'{mod} get_config\n')
             if mod_cfg is not None and mod_cfg:
                 all_props |= {k: f'{mod}@{k}' for (k,_) in mod_cfg.items()}
         prop = self.select('props', all_props.values())
@@ -93,7 +92,7 @@ class props():
             if mod is None or not mod:
                 return
             echo=reflection.echo
-            added_props = pickle.loads(await echo(f'{mod} get_added_props\n'))
+            added_props = await echo(f'{mod} get_added_props\n')
             if added_props is not None and added_props:
                 all_added_props.append(added_props)
         aprop_str=self.get_autoprop_as_str(with_title=False)
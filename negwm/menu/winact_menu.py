@@ -4,7 +4,6 @@ import sys
 from functools import partial
 from typing import Callable
 import asyncio
-import pickle
 from typing import List
 import i3ipc
 import i3ipc.con
@@ -79,7 +78,7 @@ class winact():
     async def select_ws(self) -> str:
         """ Apply target function to workspace. """
         echo = reflection.echo
-        ws_list = pickle.loads(await echo(f'configurator raw_ws\n'))
+        ws_list = await echo(f'configurator raw_ws\n')
         menu_params = {'prompt': f'{menu.wrap_str("ws")} {self.prompt}'}
         return_with_number = False
         try:
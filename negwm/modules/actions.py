@@ -11,6 +11,7 @@ import logging
 from negwm.lib.display import Display
 from negwm.lib.cfg import cfg
 from negwm.lib.extension import extension
+from negwm.lib.router import command
 
 # # Grid floating windows
 # mode "i3grid" {
@@ -101,18 +102,21 @@ class actions(extension, cfg):
             'height': int(win.rect.height * coeff),
         }
 
+    @command()
     def grow(self) -> None:
         """ Grow floating window geometry by [self.grow_coeff]. """
-        focused = self.i3ipc.get_tree().find_focused()
+        focused = self.focused(sync=True)
         geom = actions.multiple_geom(focused, self.grow_coeff)
-        actions.set_geom(focused, geom)
+        self.set_geom(focused, geom)
 
+    @command()
     def shrink(self) -> None:
         """ Shrink floating window geometry by [self.shrink_coeff]. """
-        focused = self.i3ipc.get_tree().find_focused()
+        focused = self.focused(sync=True)
         geom = actions.multiple_geom(focused, self.shrink_coeff)
-        actions.set_geom(focused, geom)
+        self.set_geom(focused, geom)
 
+    @command()
     def x2(self, mode: str) -> None:
         """ Move window to the 1st or 2nd half of the screen space with the
             given orientation.
@@ -122,7 +126,7 @@ class actions(extension, cfg):
         curr_scr = self.current_resolution
         half_width = int(curr_scr['width'] / 2)
         half_height = int(curr_scr['height'] / 2)
-        self.current_win = self.i3ipc.get_tree().find_focused()
+        self.current_win = self.focused(sync=True)
         # Config about useless gaps for half splitting, True by default
         if self.conf('x2_use_gaps'):
             gaps = self.useless_gaps
@@ -167,13 +171,14 @@ class actions(extension, cfg):
                 prev = self.geom_list[-1].get('id', {})
                 if prev != self.current_win.id:
                     geom = self.get_prev_geom()
-            actions.set_geom(self.current_win, geom)
+            self.set_geom(self.current_win, geom)
 
+    @command()
     def maximize(self, by: str = 'XY') -> None:
         """ Maximize window by attribute.
         by (str): maximize by X, Y or XY. """
         geom = {}
-        self.current_win = self.i3ipc.get_tree().find_focused()
+        self.current_win = self.focused(sync=True)
         if self.current_win is not None:
             if not self.geom_list[-1]:
                 geom = self.get_prev_geom()
@@ -190,14 +195,15 @@ class actions(extension, cfg):
                 max_geom = self.maximized_geom(geom.copy(), gaps={}, byX=True, byY=False)
             elif by == 'Y':
                 max_geom = self.maximized_geom(geom.copy(), gaps={}, byX=False, byY=True)
-            actions.set_geom(self.current_win, max_geom)
+            self.set_geom(self.current_win, max_geom)
 
+    @command()
     def revert_maximize(self) -> None:
         """ Revert changed window state. """
         try:
-            focused = self.i3ipc.get_tree().find_focused()
+            focused = self.focused()
             if self.geom_list[-1].get('geom', {}):
-                actions.set_geom(focused, self.geom_list[-1]['geom'])
+                self.set_geom(focused, self.geom_list[-1]['geom'])
             del self.geom_list[-1]
         except (KeyError, TypeError, AttributeError):
             pass
@@ -219,13 +225,14 @@ class actions(extension, cfg):
             geom['height'] = self.current_resolution['height'] - gaps['s'] * 2
         return geom
 
-    @staticmethod
-    def set_geom(win, geom: dict) -> dict:
-        """ Generic function to set geometry
+    def set_geom(self, win, geom: dict) -> None:
+        """ Generic function to set geometry, move and resize are sent as
+        one command batch.
         win: target window to change windows
         geom (dict): geometry. """
-        win.command(f"move absolute position {geom['x']} {geom['y']}")
-        win.command(f"resize set {geom['width']} {geom['height']} px")
+        with self.batch() as batch:
+            batch.win(win, f"move absolute position {geom['x']} {geom['y']}")
+            batch.win(win, f"resize set {geom['width']} {geom['height']} px")
 
     @staticmethod
     def set_resize_params_single(direction, amount):
@@ -258,6 +265,7 @@ class actions(extension, cfg):
             mode = 'grow'
         return direction, mode, int(amount)
 
+    @command(str, int)
     def resize(self, direction, amount):
         """ Resize the current container along to the given direction. If there
         is only a single container, resize by adjusting gaps. If the direction
@@ -273,7 +281,7 @@ class actions(extension, cfg):
             except ValueError:
                 logging.error("Bad resize amount given.")
                 return
-        node = self.i3ipc.get_tree().find_focused()
+        node = self.focused(sync=True)
         single, vertical = True, False
         # Check if there is only a single leaf.
         # If not, check if the curent container is in a vertical split.
@@ -355,7 +363,7 @@ class actions(extension, cfg):
     def output_in_direction(self, output, window, direction):
         """ Return the output in direction 'direction' of window 'window' on
         output """
-        tree = self.i3ipc.get_tree().find_focused()
+        tree = self.focused()
         for new in self.focused_order(tree):
             if new.name == '__i3':
                 continue
@@ -370,6 +378,7 @@ class actions(extension, cfg):
                 return new
         return None
 
+    @command()
     def focus_tab(self, direction) -> None:
         """ Cycle through the innermost stacked or tabbed ancestor container,
         or through floating containers. """
@@ -379,8 +388,7 @@ class actions(extension, cfg):
             delta = -1
         else:
             return
-        tree = self.i3ipc.get_tree()
-        node = tree.find_focused()
+        node = self.focused(sync=True)
         # Find innermost tabbed or stacked container, or detect floating.
         while True:
             parent = node.parent
@@ -411,6 +419,7 @@ class actions(extension, cfg):
                 result.append(ws)
         return result
 
+    @command()
     def next_ws(self):
         ws_magic_pie = '::ws'
         focused = None
@@ -440,6 +449,7 @@ class actions(extension, cfg):
                 next_ws_name = ws_list[ws_index + 1]
             self.i3ipc.command(f'workspace {next_ws_name}')
 
+    @command()
     def move_tab(self, direction):
         """ Move the innermost stacked or tabbed ancestor container. """
         if direction == 'next':
@@ -448,7 +458,7 @@ class actions(extension, cfg):
             delta = -1
         else:
             return
-        node = self.i3ipc.get_tree().find_focused()
+        node = self.focused(sync=True)
         # Find innermost tabbed or stacked container.
         while True:
             parent = node.parent
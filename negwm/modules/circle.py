@@ -13,10 +13,13 @@ from negwm.lib.extension import extension
 from negwm.lib.matcher import Matcher
 from negwm.lib.dynamic_cfg import dynamic_cfg
 from negwm.lib.misc import Misc
+from negwm.lib.router import command
 
 
 class circle(extension, dynamic_cfg, Matcher):
     """ Circle over windows class """
+    configured_internally = True # i3 rules are generated by configurator
+
     def __init__(self, i3) -> None:
         """ Init function
         Main part is in self.initialize, which performs initialization itself.
@@ -38,22 +41,26 @@ class circle(extension, dynamic_cfg, Matcher):
         self.subtag_info = {} # Used for subtag info caching
         # Should the special fullscreen-related actions to be performed or not.
         self.need_handle_fullscreen = True
-        i3tree = self.i3ipc.get_tree()
+        i3tree = self.tree()
         self.fullscreened = i3tree.find_fullscreen() # Prepare for prefullscreen
-        # Store the current window here to cache i3.get_tree().find_focused value.
+        # Store the current window here to cache find_focused value.
         self.current_win = i3tree.find_focused()
         # Winlist is used to reduce calling i3.get_tree() too many times.
         self.winlist = i3tree.leaves()
-        self.configured_internally = True
         for tag in self.cfg:
             self.tagged[tag] = []
             self.current_position[tag] = 0
         # Tag all windows after start
         self.tag_windows(invalidate_winlist=False)
-        self.i3ipc.on('window::new', self.add_wins)
-        self.i3ipc.on('window::close', self.del_wins)
-        self.i3ipc.on('window::focus', self.set_curr_win)
-        self.i3ipc.on('window::fullscreen_mode', self.handle_fullscreen)
+        self.on('window::new', self.add_wins)
+        self.on('window::close', self.del_wins)
+        self.on('window::focus', self.set_curr_win)
+        self.on('window::fullscreen_mode', self.handle_fullscreen)
+        self.on('window::title', self.title_changed)
+
+    def published_state(self):
+        """ Tag membership for subscribe clients. """
+        return {tag: {win.id for win in wins} for tag, wins in self.tagged.items()}
 
     def rules(self, _):
         ret = ''
@@ -176,6 +183,7 @@ class circle(extension, dynamic_cfg, Matcher):
             if win.window_class == self.conf(tag, 'priority')
         ]
 
+    @command()
     def next(self, tag: str) -> None:
         """ Circle over windows. Function 'called' from the user-side.
             tag (str): denotes target [tag] """
@@ -200,6 +208,7 @@ class circle(extension, dynamic_cfg, Matcher):
             else:
                 self.focus_next(tag, idx)
 
+    @command()
     def subtag(self, tag: str, subtag: str) -> None:
         """ Circle over subtag windows. Function 'called' from the user-side.
             tag (str): denotes target [tag]
@@ -217,6 +226,7 @@ class circle(extension, dynamic_cfg, Matcher):
                 idx = 0
                 self.focus_next(tag, idx, subtagged=True)
 
+    @command()
     def add_prop(self, tag_to_add: str, prop_str: str) -> None:
         """ Add property via [prop_str] to the target [tag].
             tag (str): denotes the target tag.
@@ -228,6 +238,7 @@ class circle(extension, dynamic_cfg, Matcher):
                 self.del_props(tag, prop_str)
         self.initialize(self.i3ipc)
 
+    @command()
     def del_prop(self, tag: str, prop_str: str) -> None:
         """ Delete property via [prop_str] to the target [tag].
             tag (str): denotes the target tag.
@@ -236,24 +247,37 @@ class circle(extension, dynamic_cfg, Matcher):
         self.del_props(tag, prop_str)
         self.initialize(self.i3ipc)
 
+    def reconfigure(self, changed) -> None:
+        """ Retag only windows of the tags changed by config reload.
+            changed: tags added, removed or changed. """
+        self.winlist = self.tree().leaves()
+        self.subtag_info = {} # config of the last used subtag, may be stale
+        for tag in changed:
+            if tag not in self.cfg:
+                self.tagged.pop(tag, None)
+                self.current_position.pop(tag, None)
+                continue
+            self.tagged[tag] = []
+            self.current_position[tag] = 0
+        self.find_acceptable_windows(changed & set(self.cfg))
+
     def tag_windows(self, invalidate_winlist=True) -> None:
         """ Find acceptable windows for the all tags and add it to the
             tagged[tag] list.
             tag (str): denotes the target tag. """
         if invalidate_winlist:
-            self.winlist = self.i3ipc.get_tree().leaves()
-        self.tagged = {}
-        for tag in self.cfg:
-            self.tagged[tag] = []
-            self.find_acceptable_windows(tag)
+            self.winlist = self.tree().leaves()
+        self.tagged = {tag: [] for tag in self.cfg}
+        self.find_acceptable_windows(self.tagged)
 
-    def find_acceptable_windows(self, tag: str) -> None:
-        """ Wrapper over Matcher.match to find acceptable windows and add it to
-            tagged[tag] list.
-            tag (str): denotes the target tag. """
-        for win in self.winlist:
-            if self.match(win, tag):
-                self.tagged.get(tag, []).append(win)
+    def find_acceptable_windows(self, tags) -> None:
+        """ Wrapper over Matcher.matched_windows to find acceptable windows
+            and add it to tagged[tag] lists in one pass over winlist.
+            tags: denotes the target tags. """
+        for win, matched in self.matched_windows(self.winlist):
+            for tag in matched:
+                if tag in tags:
+                    self.tagged[tag].append(win)
 
     def sort_by_parent(self, tag: str) -> None:
         """ Sort windows by some infernal logic: At first sort by parent
@@ -276,11 +300,25 @@ class circle(extension, dynamic_cfg, Matcher):
             event: i3ipc event. We can extract window from it using
             event.container. """
         win = event.container
-        for tag in self.cfg:
-            if self.match(win, tag):
-                self.tagged[tag].append(win)
+        for tag in self.matched_tags(win):
+            self.tagged[tag].append(win)
         self.win = win
 
+    def retitle(self, win, tags, matched) -> None:
+        """ Tag or untag window which title started or stopped to match
+            name_r rules, other tags are not touched. """
+        for tag in tags:
+            tagged = self.tagged.get(tag)
+            if tagged is None:
+                continue
+            idx = next(
+                (i for i, tagged_win in enumerate(tagged) if tagged_win.id == win.id),
+                None)
+            if tag in matched and idx is None:
+                tagged.append(win)
+            elif tag not in matched and idx is not None:
+                del tagged[idx]
+
     def del_wins(self, _, event) -> None:
         """ Delete tag from window if it's closed.
             _: i3ipc connection.
@@ -315,7 +353,7 @@ class circle(extension, dynamic_cfg, Matcher):
             return
 
         win = event.container
-        self.fullscreened = self.i3ipc.get_tree().find_fullscreen()
+        self.fullscreened = self.tree().find_fullscreen()
 
         if win.fullscreen_mode and (win.id not in self.restore_fullscreen):
             self.restore_fullscreen.append(win.id)
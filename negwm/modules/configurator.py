@@ -1,5 +1,9 @@
 """ i3 config generator """
+import hashlib
+import logging
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from typing import List
 
@@ -8,6 +12,8 @@ from negwm.lib.cfg import cfg
 from negwm.lib.extension import extension
 from negwm.lib.checker import checker
 from negwm.lib.rules import Rules
+from negwm.lib.router import boolean, command
+from negwm.lib.startup_cache import StartupCache
 
 
 class configurator(extension, cfg):
@@ -15,6 +21,8 @@ class configurator(extension, cfg):
     header='# :>> NegWM'
     ending='# vim:filetype=i3config\n'
     create_header=Misc.create_header_tiny
+    write_lock=threading.Lock()
+    installer=None # one background worker for validation and file writes
 
     def __init__(self, i3) -> None:
         super().__init__()
@@ -33,12 +41,62 @@ class configurator(extension, cfg):
         return bool(getattr(module, 'configured_internally'))
 
 
+    @command()
     def print(self) -> None: print(self.generate_config())
 
-    def write(self, preserve_history=False):
+    @staticmethod
+    def digest(path) -> str:
+        try:
+            with open(path, 'rb') as fp:
+                return hashlib.sha1(fp.read()).hexdigest()
+        except OSError:
+            return ''
+
+    @command(boolean)
+    def write(self, preserve_history=False) -> None:
+        """ Generate i3 config from the module configs here, where i3 events
+        are handled, then validate and install it in background and reload
+        i3 back on the event thread. Does nothing when the generated part
+        and the i3 config file are the same as after the last write, so
+        repeated calls are cheap. """
+        self.write_async(preserve_history)
+
+    def write_async(self, preserve_history=False) -> Future:
+        """ write, returns the future of the install: True when i3 config
+        file was changed. Installs run one by one on a single worker thread,
+        right here without negwm runner. """
+        generated_cfg = self.generate_config()
+        def install():
+            try:
+                with configurator.write_lock:
+                    changed = configurator.install(generated_cfg, preserve_history)
+            except Exception:
+                logging.exception('i3 config install failed')
+                return False
+            if changed and self.i3ipc is not None:
+                extension.call_later(0, self.i3ipc.command, 'reload')
+            return changed
+        if extension.dispatcher is None:
+            future = Future()
+            future.set_result(install())
+            return future
+        if configurator.installer is None:
+            configurator.installer = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='i3-config')
+        return configurator.installer.submit(install)
+
+    @staticmethod
+    def install(generated_cfg, preserve_history) -> bool:
+        """ Validate generated config and put it into the i3 config file,
+        touches files only. Returns True when i3 config was changed. """
         cfg, test_cfg = 'config', '.config_test'
         i3_cfg_dir = Misc.i3path()
-        generated_cfg = self.generate_config()
+        generated = hashlib.sha1(generated_cfg.encode()).hexdigest()
+        last = StartupCache.get('i3_config', {})
+        if last.get('generated') == generated and \
+                last.get('file') == configurator.digest(f'{i3_cfg_dir}/{cfg}'):
+            return False
+        changed = False
         with open(f'{i3_cfg_dir}/{test_cfg}', 'w', encoding='utf8') as testi3:
             testi3.write(generated_cfg)
         if checker.check_i3_config(cfg=test_cfg):
@@ -56,12 +114,17 @@ class configurator(extension, cfg):
                 i3cfg.write(''.join(i3cfg_lines))
             with open(f'{i3_cfg_dir}/{cfg}', 'a', encoding='utf8') as i3cfg:
                 i3cfg.write(generated_cfg)
-                self.i3ipc.command('reload')
+            StartupCache.set('i3_config', {
+                'generated': generated,
+                'file': configurator.digest(f'{i3_cfg_dir}/{cfg}'),
+            })
+            changed = True
         if os.path.isfile(f'{i3_cfg_dir}/{test_cfg}'):
             if preserve_history:
                 os.replace(f'{i3_cfg_dir}/{test_cfg}', f'{i3_cfg_dir}/{test_cfg}_{datetime.today().strftime("%Y-%m-%d-%H-%M-%S")}')
             else:
                 os.remove(f'{i3_cfg_dir}/{test_cfg}')
+        return changed
 
     def fill(self, section='', text='', module_bindings=False) -> None:
         if module_bindings:
@@ -147,6 +210,7 @@ class configurator(extension, cfg):
                             ret += bind_command()
         return ret
 
+    @command()
     def raw_ws(self) -> List:
         return self.cfg.get('workspaces', [])
 
@@ -5,6 +5,7 @@ import shutil
 import logging
 from negwm.lib.extension import extension
 from negwm.lib.cfg import cfg
+from negwm.lib.router import command
 
 class fullscreen(extension, cfg):
     def __init__(self, i3conn):
@@ -22,8 +23,8 @@ class fullscreen(extension, cfg):
         self.cfg.setdefault('classes_to_hide_panel', [])
         self.classes_to_hide_panel = self.cfg['classes_to_hide_panel']
         self.show_panel_on_close = False
-        self.i3ipc.on('window::close', self.on_window_close)
-        self.i3ipc.on('workspace::focus', self.on_workspace_focus)
+        self.on('window::close', self.on_window_close)
+        self.on('workspace::focus', self.on_workspace_focus)
 
     def on_workspace_focus(self, _, event):
         """ Hide panel if it is fullscreen workspace, show panel otherwise """
@@ -61,9 +62,10 @@ class fullscreen(extension, cfg):
             return
         self.fullscreen()
 
+    @command()
     def fullscreen(self):
         """ Hide panel for this workspace """
-        i3_tree = self.i3ipc.get_tree()
+        i3_tree = self.tree()
         fullscreens = i3_tree.find_fullscreen()
         focused_ws = i3_tree.find_focused().workspace().name
         if not fullscreens:
@@ -76,7 +78,7 @@ class fullscreen(extension, cfg):
                             self.panel_action('hide', restore=False)
                             break
 
-    def on_window_close(self, i3conn, event):
+    def on_window_close(self, _, event):
         """ If there are no fullscreen windows then show panel closing window.
         i3: i3ipc connection.
         event: i3ipc event. We can extract window from it using
@@ -84,5 +86,5 @@ class fullscreen(extension, cfg):
         if event.container.window_class in self.panel_classes:
             return
         if self.show_panel_on_close:
-            if not i3conn.get_tree().find_fullscreen():
+            if not self.tree().find_fullscreen():
                 self.panel_action('show', restore=True)
@@ -10,6 +10,7 @@ from itertools import cycle
 from negwm.lib.cfg import cfg
 from negwm.lib.negewmh import NegEWMH
 from negwm.lib.extension import extension
+from negwm.lib.router import command
 
 class lastgo(extension, cfg):
     """ Advanced alt-tab class. """
@@ -23,16 +24,21 @@ class lastgo(extension, cfg):
         self.focus_history = [] # depth of history list
         self.max_lastgo = 4 # workspaces with auto alt-tab when close
         self.autoback = self.cfg['autoback']
-        self.i3ipc.on('window::focus', self.on_window_focus)
-        self.i3ipc.on('window::close', self.goto_nonempty_ws_on_close)
+        self.on('window::focus', self.on_window_focus)
+        self.on('window::close', self.goto_nonempty_ws_on_close)
+
+    def published_state(self):
+        """ Focus history for subscribe clients. """
+        return {'history': list(self.focus_history)}
 
     def reload(self) -> None:
         """ Reloads config. Dummy. """
         self.__init__(self.i3ipc)
 
+    @command()
     def switch(self) -> None:
         """ Focus previous window. """
-        wids = set(w.id for w in self.i3ipc.get_tree().leaves())
+        wids = set(w.id for w in self.tree().leaves())
         for wid in self.focus_history[1:]:
             if wid not in wids:
                 self.focus_history.remove(wid)
@@ -56,7 +62,7 @@ class lastgo(extension, cfg):
         """ Return iterator for windows on the current workspace. """
         return filter(
             lambda x: x.window,
-            self.i3ipc.get_tree().find_focused().workspace().leaves()
+            self.focused().workspace().leaves()
         )
 
     def goto_visible(self, reversed_order=False):
@@ -80,35 +86,38 @@ class lastgo(extension, cfg):
     def goto_any(self, reversed_order: bool = False) -> None:
         """ Focus any next window.
             reversed_order(bool) : [optional] predicate to change order. """
-        wins = self.i3ipc.get_tree().leaves()
+        wins = self.tree().leaves()
         self.goto_win(wins, reversed_order)
 
+    @command()
     def focus_next(self) -> None:
         """ Focus any next window """
         self.goto_any(reversed_order=False)
 
+    @command()
     def focus_prev(self) -> None:
         """ Focus any previous window """
         self.goto_any(reversed_order=True)
 
+    @command()
     def focus_next_visible(self) -> None:
         """ Focus next visible window """
         self.goto_visible(reversed_order=False)
 
+    @command()
     def focus_prev_visible(self) -> None:
         """ Focus previous visible window """
         self.goto_visible(reversed_order=True)
 
-    def goto_nonempty_ws_on_close(self, i3ipc, _) -> None:
+    def goto_nonempty_ws_on_close(self, *_) -> None:
         """ Go back for temporary tags like pictures or media. This function
         make auto alt-tab for workspaces which should by temporary. This is
         good if you do not want to see empty workspace after switching to the
         media content workspace.
 
-        i3ipc: i3ipc connection.
-        event: i3ipc event. We can extract window from it using
-        event.container. """
-        workspace = i3ipc.get_tree().find_focused().workspace()
+        _: i3ipc connection and i3ipc event, focused workspace is taken
+        from the shared tree cache. """
+        workspace = self.focused().workspace()
         focused_ws_name = workspace.name
         if not workspace.leaves():
             for ws_substr in self.autoback:
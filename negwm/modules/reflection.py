@@ -3,6 +3,7 @@
 import asyncio
 import sys
 from negwm.lib.extension import extension
+from negwm.lib.client import Client
 
 class reflection(extension):
     """ Class for reflection """
@@ -13,29 +14,22 @@ class reflection(extension):
         extension.__init__(self)
 
     @staticmethod
-    async def echo(message):
-        host, port = '::1', 15555
+    async def connect():
         try:
-            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=1.0)
-        except asyncio.TimeoutError:
+            return await Client.shared()
+        except (asyncio.TimeoutError, OSError):
             print('Failed to connect NegWM')
             sys.exit(1)
-        writer.write(message.encode())
-        await writer.drain()
-        data = await reader.read(2<<14)
-        writer.close()
-        await writer.wait_closed()
-        return data
+
+    @staticmethod
+    async def echo(message):
+        """ Send command, returns its decoded reply. Connection is kept
+        open and shared by the calls from the same loop. """
+        client = await reflection.connect()
+        return await client.request(message)
 
     @staticmethod
     async def run(message):
-        host, port = '::1', 15555
-        try:
-            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=2.0)
-        except asyncio.TimeoutError:
-            print('Failed to connect NegWM')
-            sys.exit(1)
-        writer.write(message.encode())
-        await writer.drain()
-        writer.close()
-        await writer.wait_closed()
+        """ Send command, wait until it is done and ignore the result. """
+        client = await reflection.connect()
+        await client.request(message)
@@ -14,6 +14,7 @@ from negwm.lib.matcher import Matcher
 from negwm.lib.negewmh import NegEWMH
 from negwm.lib.extension import extension
 from negwm.lib.misc import Misc
+from negwm.lib.router import boolean, command
 
 class scratchpad(extension, dynamic_cfg, Matcher):
     """ Named scratchpad class
@@ -21,6 +22,8 @@ class scratchpad(extension, dynamic_cfg, Matcher):
         Matcher: class to check that window can be tagged with given tag by
                  WM_CLASS, WM_INSTANCE, regexes, etc
     """
+    configured_internally = True # i3 rules are generated by configurator
+
     def __init__(self, i3) -> None:
         """ Init function
             i3: i3ipc connection """
@@ -32,7 +35,6 @@ class scratchpad(extension, dynamic_cfg, Matcher):
     def initialize(self, i3):
         self.win = None # reducing  calling i3.get_tree() too many times.
         self.fullscreen_list = [] # performing fullscreen hacks
-        self.configured_internally = True
         # scratchpad_geom used to respect current screen resolution in the geometry
         # settings and scale it
         self.scratchpad_geom = geom.Geom(self.cfg)
@@ -45,13 +47,26 @@ class scratchpad(extension, dynamic_cfg, Matcher):
         # named scratchpad with add_prop/del_prop routines
         self.focus_win_flag = [False, '']
         self.i3ipc = i3 # i3ipc connection, bypassed by negwm runner
-        i3.on('window::new', self.mark_tag)
-        i3.on('window::close', self.unmark_tag)
+        self.on('window::new', self.mark_tag)
+        self.on('window::close', self.unmark_tag)
+        self.on('window::title', self.title_changed)
+
+    def published_state(self):
+        """ Tag membership for subscribe clients. """
+        return {tag: {win.id for win in wins} for tag, wins in self.marked.items()}
 
+    @command()
     def taglist(self) -> List:
         """ Returns list of tags windows. """
         return list(self.cfg.keys())
 
+    @classmethod
+    def from_config(cls):
+        """ Config-only instance also needs geometry for the i3 rules. """
+        mod = super().from_config()
+        mod.scratchpad_geom = geom.Geom(mod.cfg)
+        return mod
+
     def rules(self, cmd_dict) -> str:
         """ Create i3 match rules for all tags. """
         ret: str = ''
@@ -72,8 +87,10 @@ class scratchpad(extension, dynamic_cfg, Matcher):
             if props is not None and props:
                 if 'transient_for' in props is not None:
                     parent_for_transient = props['transient_for']
-                    self.i3ipc.command(f'[id={parent_for_transient}] focus')
+                    with self.batch() as batch:
+                        batch.add(f'[id={parent_for_transient}] focus')
 
+    @command(str, boolean)
     def show(self, tag: str, hide: bool = True) -> None:
         """ Show given [tag]
             tag: tag string
@@ -81,42 +98,46 @@ class scratchpad(extension, dynamic_cfg, Matcher):
             be used in the most cases because of better performance and visual
             neatness """
         win_to_focus = None
-        for win in self.marked[tag]:
-            self.focus_transient_parent(tag, win.__dict__)
-            win.command('move window to workspace current')
-            win_to_focus = win
-        if hide:
-            self.hide(tag, win_to_focus)
-        if win_to_focus is not None:
-            win_to_focus.command('focus')
+        with self.batch() as batch:
+            for win in self.marked[tag]:
+                self.focus_transient_parent(tag, win.__dict__)
+                batch.win(win, 'move window to workspace current')
+                win_to_focus = win
+            if hide:
+                self.hide(tag, win_to_focus)
+            if win_to_focus is not None:
+                batch.win(win_to_focus, 'focus')
 
     def hide_scratchpad(self, tag: str) -> None:
         """ Hide given [tag]
             tag (str): scratchpad name to hide """
         if self.geom_auto_save:
             self.geom_save_(tag)
-        for win in self.marked[tag]:
-            win.command('move scratchpad')
-        self.restore_fullscreens()
+        with self.batch() as batch:
+            for win in self.marked[tag]:
+                batch.win(win, 'move scratchpad')
+            self.restore_fullscreens()
 
     def hide(self, tag: str, current_win) -> None:
         """ Hide all tagged windows except current.
             tag: tag string """
         if len(self.marked[tag]) > 1 and current_win is not None:
-            for win in self.marked[tag]:
-                if win.id != current_win.id:
-                    win.command('move scratchpad')
-                else:
-                    win.command('move window to workspace current')
+            with self.batch() as batch:
+                for win in self.marked[tag]:
+                    if win.id != current_win.id:
+                        batch.win(win, 'move scratchpad')
+                    else:
+                        batch.win(win, 'move window to workspace current')
 
     def find_visible_windows(self) -> List:
         """ Find windows on the current workspace, which is enough for scratchpads.
-        focused: denotes that [focused] window should be extracted from i3.get_tree() or not """
-        focused = self.i3ipc.get_tree().find_focused()
+        focused: denotes that [focused] window should be extracted from the tree cache or not """
+        focused = self.focused()
         return NegEWMH.find_visible_windows(
             focused.workspace().leaves()
         )
 
+    @command()
     def dialog(self) -> None:
         """ Show dialog windows """
         self.show('transients', hide=False)
@@ -125,9 +146,11 @@ class scratchpad(extension, dynamic_cfg, Matcher):
         """ Toggles fullscreen on/off and show/hide requested scratchpad after.
             w: window that fullscreen state should be on/off. """
         if win.fullscreen_mode:
-            win.command('fullscreen toggle')
+            with self.batch() as batch:
+                batch.win(win, 'fullscreen toggle')
             self.fullscreen_list.append(win)
 
+    @command()
     def toggle(self, tag: str) -> None:
         """ Toggle scratchpad with given [tag].
             tag (str): denotes the target tag. """
@@ -144,18 +167,19 @@ class scratchpad(extension, dynamic_cfg, Matcher):
             return
         # We need to hide scratchpad it is visible,
         # regardless it focused or not
-        focused = self.i3ipc.get_tree().find_focused()
+        focused = self.focused()
         self.marked.setdefault(tag, [])
         if self.marked[tag]:
-            self.toggle_fs(focused)
-            self.show(tag)
+            with self.batch():
+                self.toggle_fs(focused)
+                self.show(tag)
 
     def focus_sub_tag(self, tag: str, subtag_classes_set: Set) -> None:
         """ Cycle over the subtag windows.
             tag (str): denotes the target tag.
             subtag_classes_set (Set): subset of classes of target [tag] which
             distinguish one subtag from another. """
-        focused = self.i3ipc.get_tree().find_focused()
+        focused = self.focused()
         self.toggle_fs(focused)
         if focused.window_class in subtag_classes_set:
             return
@@ -163,8 +187,9 @@ class scratchpad(extension, dynamic_cfg, Matcher):
         for _ in self.marked[tag]:
             if focused.window_class not in subtag_classes_set:
                 self.next()
-                focused = self.i3ipc.get_tree().find_focused()
+                focused = self.focused(sync=True)
 
+    @command()
     def subtag(self, tag: str, subtag: str) -> None:
         """ Run-or-focus the application for subtag
             tag (str): denotes the target tag.
@@ -190,8 +215,9 @@ class scratchpad(extension, dynamic_cfg, Matcher):
 
     def restore_fullscreens(self) -> None:
         """ Restore all fullscreen windows """
-        for win in self.fullscreen_list:
-            win.command('fullscreen toggle')
+        with self.batch() as batch:
+            for win in self.fullscreen_list:
+                batch.win(win, 'fullscreen toggle')
         self.fullscreen_list = []
 
     def is_visible_window_with_tag(self, tag: str) -> bool:
@@ -218,11 +244,12 @@ class scratchpad(extension, dynamic_cfg, Matcher):
             hide_current and another to perform actions on the currently
             selected tag.
             func(Callable) : function to apply. """
-        curr_tag = self.get_current_tag(self.i3ipc.get_tree().find_focused())
+        curr_tag = self.get_current_tag(self.focused())
         if curr_tag:
             func(curr_tag)
         return bool(curr_tag)
 
+    @command(boolean)
     def next(self, hide: bool = True) -> None:
         """ Show the next window for the currently selected tag.
             hide (bool): hide window or not. Primarly used to cleanup 'garbage'
@@ -230,15 +257,17 @@ class scratchpad(extension, dynamic_cfg, Matcher):
             is't better to make screen clear after (re)start. """
         def next_win(tag: str) -> None:
             marks_for_tag=self.marked[tag]
-            for idx, win in enumerate(marks_for_tag):
-                if focused_win.id != win.id:
-                    win.command('move window to workspace current, move scratchpad')
-                    marks_for_tag.insert(len(marks_for_tag), marks_for_tag.pop(idx))
-            self.show(tag, hide_)
+            with self.batch() as batch:
+                for idx, win in enumerate(marks_for_tag):
+                    if focused_win.id != win.id:
+                        batch.win(win, 'move window to workspace current, move scratchpad')
+                        marks_for_tag.insert(len(marks_for_tag), marks_for_tag.pop(idx))
+                self.show(tag, hide_)
         hide_ = hide
-        focused_win = self.i3ipc.get_tree().find_focused()
+        focused_win = self.focused()
         self.apply_to_current_tag(next_win)
 
+    @command()
     def hide_current(self) -> None:
         """ Hide the currently selected tag. """
         self.apply_to_current_tag(self.hide_scratchpad)
@@ -246,15 +275,17 @@ class scratchpad(extension, dynamic_cfg, Matcher):
     def geom_restore_(self, tag: str) -> None:
         """ Restore default window geometry
         tag(str) : hide another windows for the current tag or not. """
-        for idx, win in enumerate(self.marked[tag]):
-            # delete previous mark
-            del self.marked[tag][idx]
-            # then make a new mark and move scratchpad
-            win_cmd = f'{scratchpad.mark_uuid_tag(tag)}, \
-                move scratchpad, {self.scratchpad_geom.get_geom_by_tag(tag)}'
-            win.command(win_cmd)
-            self.marked[tag].append(win)
-
+        with self.batch() as batch:
+            for idx, win in enumerate(self.marked[tag]):
+                # delete previous mark
+                del self.marked[tag][idx]
+                # then make a new mark and move scratchpad
+                win_cmd = f'{scratchpad.mark_uuid_tag(tag)}, \
+                    move scratchpad, {self.scratchpad_geom.get_geom_by_tag(tag)}'
+                batch.win(win, win_cmd)
+                self.marked[tag].append(win)
+
+    @command()
     def geom_restore(self) -> None:
         """ Restore geometry for the current selected tag. """
         self.apply_to_current_tag(self.geom_restore_)
@@ -262,7 +293,7 @@ class scratchpad(extension, dynamic_cfg, Matcher):
     def geom_dump_(self, tag: str) -> None:
         """ Dump geometry for the given tag
             tag(str): denotes target tag. """
-        focused = self.i3ipc.get_tree().find_focused()
+        focused = self.focused(sync=True)
         for win in self.marked[tag]:
             if win.id == focused.id:
                 focused_geom = f'{focused.rect.width}x{focused.rect.height}' \
@@ -274,7 +305,7 @@ class scratchpad(extension, dynamic_cfg, Matcher):
     def geom_save_(self, tag: str) -> None:
         """ Save geometry for the given tag
             tag(str): denotes target tag. """
-        focused = self.i3ipc.get_tree().find_focused()
+        focused = self.focused(sync=True)
         for win in self.marked[tag]:
             if win.id == focused.id:
                 focused_geom = f'{focused.rect.width}x{focused.rect.height}' \
@@ -299,18 +330,22 @@ class scratchpad(extension, dynamic_cfg, Matcher):
             not. """
         self.geom_auto_save = save
 
+    @command()
     def geom_autosave(self) -> None:
         """ Toggle autosave mode. """
         self.auto_save_geom(not self.geom_auto_save)
 
+    @command()
     def geom_dump(self) -> None:
         """ Dump geometry for the current selected tag. """
         self.apply_to_current_tag(self.geom_dump_)
 
+    @command()
     def geom_save(self) -> None:
         """ Save geometry for the current selected tag. """
         self.apply_to_current_tag(self.geom_save_)
 
+    @command()
     def add_prop(self, tag_to_add: str, prop_str: str) -> None:
         """ Add property via [prop_str] to the target [tag].
             tag_to_add (str): denotes the target tag.
@@ -322,10 +357,12 @@ class scratchpad(extension, dynamic_cfg, Matcher):
             if tag != tag_to_add:
                 self.del_props(tag, prop_str)
                 if self.marked[tag] != []:
-                    for win in self.marked[tag]:
-                        win.command('unmark')
+                    with self.batch() as batch:
+                        for win in self.marked[tag]:
+                            batch.win(win, 'unmark')
         self.initialize(self.i3ipc)
 
+    @command()
     def del_prop(self, tag: str, prop_str: str) -> None:
         """ Delete property via [prop_str] to the target [tag].
             tag (str): denotes the target tag.
@@ -335,9 +372,10 @@ class scratchpad(extension, dynamic_cfg, Matcher):
         self.initialize(self.i3ipc)
 
     def scratchpad_move(self, win, tag, show=False, hide=True):
-        win.command(
-            f'{scratchpad.mark_uuid_tag(tag)}, move scratchpad, \
-            {self.scratchpad_geom.get_geom_by_tag(tag)}')
+        with self.batch() as batch:
+            batch.win(win,
+                f'{scratchpad.mark_uuid_tag(tag)}, move scratchpad, \
+                {self.scratchpad_geom.get_geom_by_tag(tag)}')
         self.marked[tag].append(win)
         if show:
             self.show(tag, hide=hide)
@@ -360,18 +398,33 @@ class scratchpad(extension, dynamic_cfg, Matcher):
         if NegEWMH.is_window_modal(win):
             if 'transients' in self.cfg:
                 if not self.match(win, 'transients'):
-                    win.command('focus; floating disable; floating enable')
+                    with self.batch() as batch:
+                        batch.win(win, 'focus; floating disable; floating enable')
                 else:
                     self.make_transient(win)
         elif NegEWMH.is_dialog_win(win):
             self.make_transient(win)
         else:
-            for tag in self.cfg:
-                if self.match(win, tag):
+            with self.batch():
+                for tag in self.matched_tags(win):
                     self.scratchpad_move(win, tag, show=True)
             # Special hack to invalidate windows after subtag start
             self.invalidate_after_subtag_restart()
 
+    def retitle(self, win, tags, matched) -> None:
+        """ Move window to the scratchpad when its title starts to match
+            name_r rules, like a new window. Already marked windows stay
+            where they are, so title changes never pull windows out. """
+        if not matched or any(
+                marked.id == win.id for wins in self.marked.values() for marked in wins):
+            return
+        if NegEWMH.is_window_modal(win) or NegEWMH.is_dialog_win(win):
+            return
+        with self.batch():
+            for tag in tags:
+                if tag in matched:
+                    self.scratchpad_move(win, tag, show=True)
+
     def unmark_tag(self, _, event) -> None:
         """ Delete unique mark from the closed window.
             _: i3ipc connection.
@@ -392,32 +445,53 @@ class scratchpad(extension, dynamic_cfg, Matcher):
         transient_geom = self.scratchpad_geom.get_geom_by_tag('transients') or ''
         win_cmd = f"{scratchpad.mark_uuid_tag('transients')}, \
             move scratchpad {transient_geom}"
-        win.command(win_cmd)
+        with self.batch() as batch:
+            batch.win(win, win_cmd)
         self.marked['transients'].append(win)
         if show:
             self.show('transients', hide=False)
 
-    def mark_all_tags(self, hide: bool = True) -> None:
+    def reconfigure(self, changed) -> None:
+        """ Remark only windows of the tags changed by config reload.
+            changed: tags added, removed or changed. """
+        self.scratchpad_geom = geom.Geom(self.cfg)
+        for tag in changed:
+            if tag in self.cfg:
+                self.marked[tag] = []
+            else:
+                self.marked.pop(tag, None)
+        self.mark_all_tags(hide=True, tags=changed & set(self.cfg.keys()))
+
+    def mark_all_tags(self, hide: bool = True, tags=None) -> None:
         """ Add marks to the all tags.
             hide (bool): hide window or not. Primarly used to cleanup 'garbage'
             that can appear after i3 (re)start, etc. Because of I've think that
-            is't better to make screen clear after (re)start. """
-        winlist = self.i3ipc.get_tree().leaves()
+            is't better to make screen clear after (re)start.
+            tags: mark only these tags, all by default. """
+        tags = set(self.cfg if tags is None else tags)
+        if not tags:
+            return
+        winlist = self.tree().leaves()
         hide_cmd = ''
-        for win in winlist:
-            self.win = win
-            if NegEWMH.is_window_modal(win):
-                if 'transients' in self.cfg:
-                    if not self.match(win, 'transients'):
-                        win.command('focus; floating disable; floating enable')
-                    else:
+        transients = 'transients' in tags
+        with self.batch() as batch:
+            for win, matched in self.matched_windows(winlist):
+                matched = [tag for tag in matched if tag in tags]
+                if not matched and not transients:
+                    continue # EWMH state does not matter, skip X requests
+                self.win = win
+                if NegEWMH.is_window_modal(win):
+                    if transients:
+                        if not self.match(win, 'transients'):
+                            batch.win(win, 'focus; floating disable; floating enable')
+                        else:
+                            self.make_transient(win)
+                elif NegEWMH.is_dialog_win(win):
+                    if transients:
                         self.make_transient(win)
-            elif NegEWMH.is_dialog_win(win):
-                self.make_transient(win)
-            else:
-                for tag in self.cfg:
-                    if self.match(win, tag):
+                else:
+                    for tag in matched:
                         if hide: hide_cmd = '[con_id=__focused__] scratchpad show'
                         self.scratchpad_move(win ,tag)
-                        win.command(hide_cmd)
-            self.win = win
+                        batch.win(win, hide_cmd)
+                self.win = win